@@ -0,0 +1,71 @@
+import copy
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin, clone
+from sklearn.metrics import r2_score
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.utils import check_random_state
+from depth_sweep import truncated_predictions
+
+class BaggedTreeRegressor(BaseEstimator, RegressorMixin):
+    """ Average of regression trees fitted to bootstrap samples of the data.
+        Each sample leaves out about a third of the rows, and the trees that
+        did not see a row predict it. Those out-of-bag predictions give an
+        estimate of generalization without any refitting. Since a shallower
+        tree is a truncation of a deeper one, one ensemble grown to max_depth
+        gives the out-of-bag R^2 of every smaller depth too (oob_scores_,
+        indexed by depth from 0 to max_depth, or to the deepest tree). """
+
+    def __init__(self, n_estimators = 100, max_depth = None, estimator = None, random_state = None):
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.estimator = estimator
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        n = len(y)
+        rng = check_random_state(self.random_state)
+        base = clone(self.estimator) if self.estimator is not None else DecisionTreeRegressor()
+        base.set_params(max_depth = self.max_depth)
+
+        self.estimators_ = []
+        self.in_bag_ = np.zeros((self.n_estimators, n), dtype = bool)
+        for k in range(self.n_estimators):
+            rows = rng.randint(0, n, n)
+            tree = clone(base)
+            if 'random_state' in tree.get_params():
+                tree.set_params(random_state = rng.randint(np.iinfo(np.int32).max))
+            self.estimators_.append(tree.fit(X[rows], y[rows]))
+            self.in_bag_[k, rows] = True
+        self.depth_ = max(tree.tree_.max_depth for tree in self.estimators_)
+
+        # Out-of-bag predictions at every depth 0..max_depth, or 0..depth_
+        # without a limit; trees that stop early predict the same below depth_
+        levels = self.depth_ if self.max_depth is None else max(self.depth_, self.max_depth)
+        sums = np.zeros((levels + 1, n))
+        counts = np.zeros(n)
+        for tree, in_bag in zip(self.estimators_, self.in_bag_):
+            oob = ~in_bag
+            sums[:, oob] += truncated_predictions(tree, X[oob], levels)
+            counts[oob] += 1
+        predicted = counts > 0
+        self.oob_prediction_ = sums[:, predicted] / counts[predicted]
+        self.oob_scores_ = np.array([r2_score(y[predicted], p) for p in self.oob_prediction_])
+        self.oob_score_ = self.oob_scores_[-1]
+        return self
+
+    def truncated(self, max_depth):
+        """ This ensemble with every tree cut off at max_depth. The same as
+            fitting at that depth on the same bootstrap samples, up to how
+            ties between equally good splits are broken. """
+        reg = copy.copy(self)
+        reg.max_depth = max_depth
+        return reg
+
+    def predict(self, X):
+        X = np.asarray(X, dtype = np.float64)
+        if self.max_depth is None or self.max_depth >= self.depth_:
+            return np.mean([tree.predict(X) for tree in self.estimators_], axis = 0)
+        return np.mean([truncated_predictions(tree, X, self.max_depth)[self.max_depth]
+                        for tree in self.estimators_], axis = 0)
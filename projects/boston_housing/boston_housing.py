@@ -1,81 +1,132 @@
-# Import libraries necessary for this project
-import numpy as np
-import pandas as pd
-import visuals as vs # Supplementary code
-from sklearn.cross_validation import ShuffleSplit
+# Libraries are imported where they are used, so that importing this module
+# (e.g. for performance_metric or fit_model) stays fast
+import os
 
 # Pretty display for notebooks
 #%matplotlib inline
 
-# Load the Boston housing dataset
-data = pd.read_csv('housing.csv')
-prices = data['MEDV']
-features = data.drop('MEDV', axis = 1)
-    
-# Success
-print 'Boston housing dataset has {} data points with {} ' \
-      'variables each.'.format(*data.shape)
-
-minimum_price = np.min(prices)
-maximum_price = np.max(prices)
-mean_price = np.mean(prices)
-median_price = np.median(prices)
-std_price = np.std(prices)
-
-# Show the calculated statistics
-print "Statistics for Boston housing dataset:\n"
-print "Minimum price: ${:,.2f}".format(minimum_price)
-print "Maximum price: ${:,.2f}".format(maximum_price)
-print "Mean price: ${:,.2f}".format(mean_price)
-print "Median price ${:,.2f}".format(median_price)
-print "Standard deviation of prices: ${:,.2f}".format(std_price)
-
-from sklearn.metrics import r2_score
+class HousingData(object):
+    """ The Boston housing dataset, read from the CSV file on first use. """
 
-def performance_metric(y_true, y_predict):
-    """ Calculates and returns the performance score between 
-        true and predicted values based on the metric chosen. """
-    
-    score = r2_score(y_true, y_predict)
-    return score
+    def __init__(self, path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'housing.csv')):
+        self.path = path
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            import pandas as pd
+            self._data = pd.read_csv(self.path)
+        return self._data
+
+    @property
+    def prices(self):
+        return self.data['MEDV']
+
+    @property
+    def features(self):
+        return self.data.drop('MEDV', axis = 1)
+
+    def split(self, test_size = 0.2, random_state = 0):
+        """ X_train, X_test, y_train, y_test """
+        from sklearn.cross_validation import train_test_split
+        return train_test_split(self.features.values, self.prices, test_size = test_size, random_state = random_state)
 
-# Calculate the performance of this model
-score = performance_metric([3, -0.5, 2, 7, 4.2], [2.5, 0.0, 2.1, 7.8, 5.3])
-print "Model has a coefficient of determination, R^2, of {:.3f}.".format(score)
 
-from sklearn.cross_validation import train_test_split
+# Load the Boston housing dataset (lazily)
+housing = HousingData()
 
-X_train, X_test, y_train, y_test = \
-    train_test_split(features.values, prices, test_size=0.2, random_state=0)
 
-# Success
-print "Training and testing split was successful."
+def print_statistics(prices):
+    import numpy as np
+
+    minimum_price = np.min(prices)
+    maximum_price = np.max(prices)
+    mean_price = np.mean(prices)
+    median_price = np.median(prices)
+    std_price = np.std(prices)
+
+    # Show the calculated statistics
+    print "Statistics for Boston housing dataset:\n"
+    print "Minimum price: ${:,.2f}".format(minimum_price)
+    print "Maximum price: ${:,.2f}".format(maximum_price)
+    print "Mean price: ${:,.2f}".format(mean_price)
+    print "Median price ${:,.2f}".format(median_price)
+    print "Standard deviation of prices: ${:,.2f}".format(std_price)
+
+
+def performance_metric(y_true, y_predict):
+    """ Calculates and returns the performance score between
+        true and predicted values based on the metric chosen. """
+    from sklearn.metrics import r2_score
+
+    score = r2_score(y_true, y_predict)
+    return score
 
-#vs.ModelLearning(features, prices)
-#vs.ModelComplexity(features, prices)
 
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.metrics import make_scorer
-from sklearn.grid_search import GridSearchCV
+def fit_model(X, y, estimator = None):
+    """ Performs grid search over the 'max_depth' parameter for a
+        decision tree regressor trained on the input data [X, y].
+        A DecisionTreeRegressor unless another tree estimator is given. """
+    import numpy as np
+    from sklearn.cross_validation import ShuffleSplit
+    from depth_sweep import DepthSweepCV
+    from model_cache import default_cache
 
-def fit_model(X, y):
-    """ Performs grid search over the 'max_depth' parameter for a 
-        decision tree regressor trained on the input data [X, y]. """
-    
     # Create cross-validation sets from the training data
     cv_sets = ShuffleSplit(X.shape[0], n_iter = 10, test_size = 0.20, random_state = 0)
 
-    regressor = DecisionTreeRegressor()
-    params = { 'max_depth': np.arange(1,11) }
-    scoring_fnc = make_scorer(performance_metric)
-    grid = GridSearchCV(regressor, params, scoring = scoring_fnc, cv = cv_sets)
+    # Scores every max_depth from 1 to 10 with one full tree per split
+    grid = DepthSweepCV(np.arange(1,11), cv = cv_sets, scoring = performance_metric, \
+        cache = default_cache, estimator = estimator)
     grid = grid.fit(X, y)
 
     return grid.best_estimator_
 
-# Fit the training data to the model using grid search
-reg = fit_model(X_train, y_train)
 
-# Produce the value for 'max_depth'
-print "Parameter 'max_depth' is {} for the optimal model.".format(reg.get_params()['max_depth'])
+def fit_bagged_model(X, y, estimator = None, n_estimators = 100, random_state = None):
+    """ Picks 'max_depth' from 1 to 10 by out-of-bag R^2 of one bagged
+        ensemble of trees grown to depth 10, and returns the ensemble
+        truncated at that depth. """
+    import numpy as np
+    from bagging import BaggedTreeRegressor
+
+    bagged = BaggedTreeRegressor(n_estimators, max_depth = 10, estimator = estimator, \
+        random_state = random_state).fit(X, y)
+    best_depth = np.argmax(bagged.oob_scores_[1:]) + 1
+
+    return bagged.truncated(best_depth)
+
+
+def main():
+    data = housing.data
+
+    # Success
+    print 'Boston housing dataset has {} data points with {} ' \
+          'variables each.'.format(*data.shape)
+
+    print_statistics(housing.prices)
+
+    # Calculate the performance of this model
+    score = performance_metric([3, -0.5, 2, 7, 4.2], [2.5, 0.0, 2.1, 7.8, 5.3])
+    print "Model has a coefficient of determination, R^2, of {:.3f}.".format(score)
+
+    X_train, X_test, y_train, y_test = housing.split()
+
+    # Success
+    print "Training and testing split was successful."
+
+    #import visuals as vs # Supplementary code
+    #vs.ModelLearning(housing.features, housing.prices)
+    #vs.ModelComplexity(housing.features, housing.prices)
+
+    # Fit the training data to the model using grid search
+    reg = fit_model(X_train, y_train)
+
+    # Produce the value for 'max_depth'
+    print "Parameter 'max_depth' is {} for the optimal model.".format(reg.get_params()['max_depth'])
+    return reg
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import multiprocessing
+import numpy as np
+from multiprocessing.sharedctypes import RawArray
+from sklearn.base import clone
+from sklearn.cross_validation import train_test_split
+from sklearn.metrics import r2_score
+from sklearn.tree import DecisionTreeRegressor
+from depth_sweep import truncated_predictions
+
+# Training data of a worker process, views of the engine's shared memory
+_X = None
+_y = None
+_cache = None  # model_cache.ModelCache, if any
+
+def _share(a):
+    """ Copy an array of floats into shared memory. """
+    a = np.asarray(a, dtype = np.float64)
+    raw = RawArray('d', a.size)
+    np.frombuffer(raw, dtype = np.float64)[:] = a.ravel()
+    return raw, a.shape
+
+def _attach(X, X_shape, y, y_shape, cache):
+    """ Pool initializer: the shared arrays are inherited by each worker, not pickled. """
+    global _X, _y, _cache
+    _X = np.frombuffer(X, dtype = np.float64).reshape(X_shape)
+    _y = np.frombuffer(y, dtype = np.float64).reshape(y_shape)
+    _cache = cache
+
+def _fit_and_score(task):
+    """ Fit an estimator on the train rows, then score it on the train and test rows. """
+    estimator, train, test, scoring = task
+    if _cache is not None:
+        return _cache.fit_and_score(estimator, _X, _y, train, test, scoring)
+    estimator = clone(estimator).fit(_X[train], _y[train])
+    return (scoring(_y[train], estimator.predict(_X[train])),
+            scoring(_y[test], estimator.predict(_X[test])))
+
+def _depth_curve(task):
+    """ Train and test scores of one split at every (depth, train size).
+        One tree per train size, grown to the largest depth, gives the scores
+        of all depths by truncation. The train subsets are nested prefixes, so for sklearn
+        trees the feature columns are sorted once for the largest subset and
+        each smaller subset's order is filtered from it. Nothing else is shared
+        between sizes: each still gets a fit of its own, so a curve costs
+        about the sum of one fit per size, not one fit at the largest. """
+    estimator, train, test, train_sizes, depths, scoring = task
+    if _cache is not None:
+        key = _cache.key('depth_curve', _depth_curve, truncated_predictions, estimator, _X[train], _y[train],
+                         _X[test], _y[test], train_sizes, depths, scoring)
+        scores = _cache.get(key)
+        if scores is not None:
+            return scores
+
+    X_train, y_train, X_test, y_test = _X[train], _y[train], _X[test], _y[test]
+    presort = isinstance(estimator, DecisionTreeRegressor)
+    if presort:
+        # Sorted as the tree sorts them, in float32
+        full_sorted = np.argsort(X_train[:max(train_sizes)].astype(np.float32), axis = 0).T
+    train_scores = np.empty((len(depths), len(train_sizes)))
+    test_scores = np.empty((len(depths), len(train_sizes)))
+    for i, n in enumerate(train_sizes):
+        tree = clone(estimator).set_params(max_depth = max(depths))
+        if presort:
+            # sklearn expects these as int32 in Fortran order, and does not convert them
+            X_idx_sorted = np.asfortranarray(full_sorted[full_sorted < n].reshape(-1, n).T, dtype = np.int32)
+            tree.set_params(presort = True).fit(X_train[:n], y_train[:n], X_idx_sorted = X_idx_sorted)
+        else:
+            tree.fit(X_train[:n], y_train[:n])
+        train_pred = truncated_predictions(tree, X_train[:n], max(depths))
+        test_pred = truncated_predictions(tree, X_test, max(depths))
+        for j, depth in enumerate(depths):
+            train_scores[j, i] = scoring(y_train[:n], train_pred[depth])
+            test_scores[j, i] = scoring(y_test, test_pred[depth])
+
+    if _cache is not None:
+        _cache.put(key, (train_scores, test_scores))
+    return train_scores, test_scores
+
+def _fit_trial(task):
+    """ Fit a model with fitter on the training part of one random train/test split. """
+    fitter, k, test_size = task
+    X_train, X_test, y_train, y_test = train_test_split(_X, _y, test_size = test_size, random_state = k)
+    return fitter(X_train, y_train)
+
+
+class CVEngine(object):
+    """ Runs cross-validation fits on a pool of worker processes.
+        X and y are placed in shared memory once; each task only sends the
+        estimator and the row indices of its split. With a ModelCache, fits
+        and scores computed before are reused. """
+
+    def __init__(self, X, y, processes = None, cache = None):
+        X, X_shape = _share(X)
+        y, y_shape = _share(y)
+        self.pool = multiprocessing.Pool(processes, _attach, (X, X_shape, y, y_shape, cache))
+
+    def scores(self, tasks, scoring = r2_score):
+        """ Train and test scores of (estimator, train, test) tasks, in order. """
+        results = self.pool.map(_fit_and_score, [(e, train, test, scoring) for e, train, test in tasks])
+        return np.array([r[0] for r in results]), np.array([r[1] for r in results])
+
+    def learning_curves(self, estimators, cv, train_sizes, scoring = r2_score):
+        """ learning_curve() of several estimators, scheduled as one batch of fits.
+            Returns the train sizes and arrays of shape
+            (estimators, train sizes, splits) of train and test scores. """
+        folds = list(cv)
+        tasks = [(e, train[:n], test) for e in estimators for n in train_sizes for train, test in folds]
+        shape = (len(estimators), len(train_sizes), len(folds))
+        train_scores, test_scores = self.scores(tasks, scoring)
+        return np.asarray(train_sizes), train_scores.reshape(shape), test_scores.reshape(shape)
+
+    def depth_learning_curves(self, estimator, depths, cv, train_sizes, scoring = r2_score):
+        """ learning_curves() of estimator at each max_depth in depths, with
+            one task per split that fits each train size once for all depths
+            (see _depth_curve). The estimator must keep an sklearn-style tree_.
+            Scores match up to how ties between equally good splits are broken. """
+        folds = list(cv)
+        results = self.pool.map(_depth_curve, [(estimator, train, test, train_sizes, depths, scoring)
+                                               for train, test in folds])
+        # (splits, depths, train sizes) -> (depths, train sizes, splits)
+        train_scores = np.array([r[0] for r in results]).transpose(1, 2, 0)
+        test_scores = np.array([r[1] for r in results]).transpose(1, 2, 0)
+        return np.asarray(train_sizes), train_scores, test_scores
+
+    def learning_curve(self, estimator, cv, train_sizes, scoring = r2_score):
+        """ Same results as sklearn's learning_curve with absolute train_sizes. """
+        sizes, train_scores, test_scores = self.learning_curves([estimator], cv, train_sizes, scoring)
+        return sizes, train_scores[0], test_scores[0]
+
+    def validation_curve(self, estimator, param_name, param_range, cv, scoring = r2_score):
+        """ Same results as sklearn's validation_curve: arrays of shape (params, splits). """
+        folds = list(cv)
+        tasks = [(clone(estimator).set_params(**{param_name: v}), train, test)
+                 for v in param_range for train, test in folds]
+        train_scores, test_scores = self.scores(tasks, scoring)
+        shape = (len(param_range), len(folds))
+        return train_scores.reshape(shape), test_scores.reshape(shape)
+
+    def fit_trials(self, fitter, trials, test_size = 0.2):
+        """ Models returned by fitter(X_train, y_train) for the splits with random_state = 0 .. trials - 1. """
+        return self.pool.map(_fit_trial, [(fitter, k, test_size) for k in range(trials)])
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
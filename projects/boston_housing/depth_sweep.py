@@ -0,0 +1,77 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.tree import DecisionTreeRegressor
+from sklearn.metrics import r2_score
+
+def truncated_predictions(tree, X, max_depth):
+    """ Predictions of a fitted tree cut off at every depth 0..max_depth.
+        Row d holds what the same tree grown to max_depth = d would predict:
+        a depth-limited tree is the full tree with its nodes at depth d
+        turned into leaves. """
+
+    t = tree.tree_
+    # sklearn trees split on float32 features, so compare in float32 as predict() does
+    X = np.asarray(X, dtype = np.float32 if isinstance(tree, DecisionTreeRegressor) else np.float64)
+    rows = np.arange(X.shape[0])
+    nodes = np.zeros(X.shape[0], dtype = np.intp)
+    values = t.value[:, 0, 0]
+    predictions = np.empty((max_depth + 1, X.shape[0]))
+    for d in range(max_depth + 1):
+        predictions[d] = values[nodes]
+        internal = t.children_left[nodes] != -1
+        if not internal.any():
+            predictions[d + 1:] = predictions[d]
+            break
+        go_left = X[rows, np.maximum(t.feature[nodes], 0)] <= t.threshold[nodes]
+        nodes = np.where(internal, np.where(go_left, t.children_left[nodes], t.children_right[nodes]), nodes)
+    return predictions
+
+
+class DepthSweepCV(object):
+    """ Cross-validated search over 'max_depth' for a decision tree regressor.
+        Gives the scores of a grid search over max_depth, but grows a
+        single unrestricted tree per fold and scores every depth from its
+        truncations, instead of fitting one tree per depth and fold.
+        Scores match up to how ties between equally good splits are broken,
+        which sklearn leaves to random_state (and to chance by default).
+        Another estimator with a max_depth parameter and an sklearn-style
+        tree_, e.g. hist_tree.HistogramTreeRegressor, can be searched instead. """
+
+    def __init__(self, depths, cv, scoring = r2_score, random_state = None, cache = None, estimator = None):
+        self.depths = depths
+        self.cv = cv
+        self.scoring = scoring
+        self.random_state = random_state
+        self.cache = cache  # model_cache.ModelCache for the fitted trees, if any
+        self.estimator = estimator if estimator is not None else DecisionTreeRegressor(random_state = random_state)
+
+    def _fit(self, X, y, max_depth = None):
+        tree = clone(self.estimator).set_params(max_depth = max_depth)
+        if self.cache is not None:
+            return self.cache.fit(tree, X, y)
+        return tree.fit(X, y)
+
+    def fit(self, X, y):
+        X, y = np.asarray(X), np.asarray(y)
+        depths = np.asarray(self.depths)
+        folds = list(self.cv)
+
+        # Scores per depth (rows) and fold (columns)
+        self.scores_ = np.empty((len(depths), len(folds)))
+        self.train_scores_ = np.empty((len(depths), len(folds)))
+        for k, (train, test) in enumerate(folds):
+            tree = self._fit(X[train], y[train])
+            test_pred = truncated_predictions(tree, X[test], depths.max())
+            train_pred = truncated_predictions(tree, X[train], depths.max())
+            for i, depth in enumerate(depths):
+                self.scores_[i, k] = self.scoring(y[test], test_pred[depth])
+                self.train_scores_[i, k] = self.scoring(y[train], train_pred[depth])
+
+        # Folds are weighted by their number of test samples, as GridSearchCV does
+        weights = np.array([len(test) for _, test in folds], dtype = float)
+        mean_scores = self.scores_.dot(weights) / weights.sum()
+        best = np.argmax(mean_scores)
+        self.best_params_ = {'max_depth': depths[best]}
+        self.best_score_ = mean_scores[best]
+        self.best_estimator_ = self._fit(X, y, depths[best])
+        return self
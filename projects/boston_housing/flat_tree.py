@@ -0,0 +1,180 @@
+import json
+import time
+import Queue
+import argparse
+import threading
+import numpy as np
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+class FlatTree(object):
+    """ A fitted regression tree as five compact arrays, for fast batch predictions.
+        Node i splits on feature[i] at threshold[i], sending rows with
+        x <= threshold to left[i] and the others to right[i]; leaves have
+        left = right = -1 and predict value[i]. """
+
+    def __init__(self, feature, threshold, left, right, value, dtype = np.float64):
+        self.feature = np.asarray(feature, dtype = np.int32)
+        self.threshold = np.asarray(threshold, dtype = np.float64)
+        self.left = np.asarray(left, dtype = np.int32)
+        self.right = np.asarray(right, dtype = np.int32)
+        self.value = np.asarray(value, dtype = np.float64)
+        self.dtype = np.dtype(dtype)  # features are compared with thresholds in this precision
+
+        # For predict(): leaves point to themselves and send every row left,
+        # so all rows can take the same number of steps; node i's children are
+        # at 2 * i (left) and 2 * i + 1 (right) of self.children
+        leaf = self.left == -1
+        nodes = np.arange(len(self.left))
+        self.children = np.empty(2 * len(nodes), dtype = np.intp)
+        self.children[0::2] = np.where(leaf, nodes, self.left)
+        self.children[1::2] = np.where(leaf, nodes, self.right)
+        self.step_threshold = np.where(leaf, np.inf, self.threshold)
+        self.step_feature = self.feature.astype(np.intp)
+        depth = np.zeros(len(nodes), dtype = int)
+        for i in np.flatnonzero(~leaf):  # children always follow their parent
+            depth[self.left[i]] = depth[self.right[i]] = depth[i] + 1
+        self.depth = depth.max()
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """ Flatten a fitted DecisionTreeRegressor or HistogramTreeRegressor. """
+        t = estimator.tree_
+        # sklearn trees are grown on float32 features
+        dtype = np.float64 if hasattr(estimator, 'bin_thresholds_') else np.float32
+        return cls(np.maximum(t.feature, 0), t.threshold, t.children_left, t.children_right,
+                   t.value[:, 0, 0], dtype)
+
+    def predict(self, X):
+        """ Predictions for all rows of X, stepping every row down one level at a time. """
+        X = np.ascontiguousarray(X, dtype = self.dtype)
+        values = X.ravel()
+        row_starts = np.arange(X.shape[0]) * X.shape[1]
+        nodes = np.zeros(X.shape[0], dtype = np.intp)
+        for level in range(self.depth):
+            go_right = ~(values.take(row_starts + self.step_feature.take(nodes)) <= self.step_threshold.take(nodes))
+            nodes = self.children.take(2 * nodes + go_right)
+        return self.value.take(nodes)
+
+    def save(self, path):
+        np.savez(path, feature = self.feature, threshold = self.threshold, left = self.left,
+                 right = self.right, value = self.value, dtype = self.dtype.str)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data['feature'], data['threshold'], data['left'], data['right'], data['value'],
+                   str(data['dtype']))
+
+
+class Batcher(object):
+    """ Collects rows from concurrent requests and predicts them together.
+        A batch is predicted once max_rows rows are waiting or the oldest
+        request has waited max_wait seconds. """
+
+    def __init__(self, tree, max_rows = 10000, max_wait = 0.005):
+        self.tree = tree
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.requests = Queue.Queue()
+        worker = threading.Thread(target = self.run, name = 'Batcher')
+        worker.daemon = True
+        worker.start()
+
+    def predict(self, rows):
+        """ Called by request threads; blocks until the rows' batch is done. """
+        rows = np.asarray(rows, dtype = np.float64)
+        if rows.ndim != 2 or rows.shape[1] <= self.tree.feature.max():
+            raise ValueError('Expected a list of feature rows')
+        request = {'rows': rows, 'done': threading.Event()}
+        self.requests.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['prices']
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            n = len(batch[0]['rows'])
+            deadline = time.time() + self.max_wait
+            while n < self.max_rows:
+                try:
+                    batch.append(self.requests.get(timeout = max(0, deadline - time.time())))
+                except Queue.Empty:
+                    break
+                n += len(batch[-1]['rows'])
+            try:
+                prices = self.tree.predict(np.concatenate([r['rows'] for r in batch]))
+            except Exception as e:
+                for r in batch:
+                    r['error'] = e
+            else:
+                start = 0
+                for r in batch:
+                    r['prices'] = prices[start:start + len(r['rows'])]
+                    start += len(r['rows'])
+            for r in batch:
+                r['done'].set()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """ POST /predict with {"rows": [[RM, LSTAT, PTRATIO], ...]} returns {"prices": [...]}.
+        Failed requests get {"error": "..."}, with status 400 for bad input
+        and 500 for anything else. """
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self.send_error(404)
+            return
+        try:
+            rows = json.loads(self.rfile.read(int(self.headers.getheader('content-length', 0))))['rows']
+            result = {'prices': self.server.batcher.predict(rows).tolist()}
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            self.send_json(500, {'error': '{}: {}'.format(type(e).__name__, e)})
+        else:
+            self.send_json(200, result)
+
+    def send_json(self, code, result):
+        body = json.dumps(result)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PredictionServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, tree, max_rows = 10000, max_wait = 0.005):
+        HTTPServer.__init__(self, address, PredictionHandler)
+        self.batcher = Batcher(tree, max_rows, max_wait)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Export the fitted housing model and serve its predictions.')
+    subparsers = parser.add_subparsers(dest = 'command')
+    export = subparsers.add_parser('export', help = 'fit the model as boston_housing.py does and save it')
+    export.add_argument('model', help = 'output file (.npz)')
+    serve = subparsers.add_parser('serve', help = 'serve predictions over HTTP')
+    serve.add_argument('model', help = 'file written by export')
+    serve.add_argument('--host', default = '127.0.0.1')
+    serve.add_argument('--port', type = int, default = 8000)
+    serve.add_argument('--max-wait', type = float, default = 0.005, help = 'seconds to wait for a batch to fill')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        import boston_housing
+        reg = boston_housing.main()
+        FlatTree.from_estimator(reg).save(args.model)
+        print "Saved the model to {}".format(args.model)
+    else:
+        server = PredictionServer((args.host, args.port), FlatTree.load(args.model), max_wait = args.max_wait)
+        print "Serving predictions on http://{}:{}/predict".format(args.host, args.port)
+        server.serve_forever()
@@ -0,0 +1,129 @@
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+
+class Tree(object):
+    """ Fitted tree as flat node arrays, laid out like sklearn's tree_:
+        leaves have children_left = children_right = -1. """
+
+    def __init__(self, feature, threshold, children_left, children_right, value, max_depth):
+        self.feature = np.array(feature, dtype = np.intp)
+        self.threshold = np.array(threshold, dtype = np.float64)
+        self.children_left = np.array(children_left, dtype = np.intp)
+        self.children_right = np.array(children_right, dtype = np.intp)
+        self.value = np.array(value, dtype = np.float64).reshape(-1, 1, 1)
+        self.node_count = len(self.value)
+        self.max_depth = max_depth
+
+    def apply(self, X):
+        """ Leaf reached by every row of X, stepping all rows down one level at a time. """
+        nodes = np.zeros(X.shape[0], dtype = np.intp)
+        rows = np.arange(X.shape[0])
+        internal = self.children_left[nodes] != -1
+        while internal.any():
+            i = rows[internal]
+            n = nodes[i]
+            go_left = X[i, self.feature[n]] <= self.threshold[n]
+            nodes[i] = np.where(go_left, self.children_left[n], self.children_right[n])
+            internal = self.children_left[nodes] != -1
+        return nodes
+
+
+class HistogramTreeRegressor(BaseEstimator, RegressorMixin):
+    """ Regression tree that bins every feature once, into at most max_bins
+        quantile bins, and finds the best split of a node from cumulative sums
+        of per-bin counts and targets. A node then costs time linear in its
+        number of samples, with no sorting. Splits minimize squared error, as
+        DecisionTreeRegressor's do; with no more distinct values than max_bins,
+        the same splits of the training rows are considered, at midpoints
+        between the feature's values in the whole training set rather than
+        in the node. """
+
+    def __init__(self, max_depth = None, max_bins = 256, min_samples_split = 2, min_samples_leaf = 1):
+        self.max_depth = max_depth
+        self.max_bins = max_bins
+        self.min_samples_split = min_samples_split
+        self.min_samples_leaf = min_samples_leaf
+
+    def _bin_thresholds(self, x):
+        """ Split thresholds between the bins of one feature. """
+        values = np.unique(x)
+        if len(values) <= self.max_bins:
+            return (values[:-1] + values[1:]) / 2.
+        return np.unique(np.percentile(x, np.linspace(0, 100, self.max_bins + 1)[1:-1]))
+
+    def _bin(self, X):
+        """ Bin numbers of X: bin b holds values in (thresholds[b - 1], thresholds[b]]. """
+        codes = np.empty(X.shape, dtype = np.uint8)
+        for f, thresholds in enumerate(self.bin_thresholds_):
+            codes[:, f] = np.searchsorted(thresholds, X[:, f], side = 'left')
+        return codes
+
+    def _best_split(self, codes, y):
+        """ (feature, bin) of the split with the lowest squared error, or None. """
+        n = len(y)
+        total = y.sum()
+        best_gain, best = -np.inf, None
+        for f in range(codes.shape[1]):
+            n_bins = len(self.bin_thresholds_[f]) + 1
+            counts = np.bincount(codes[:, f], minlength = n_bins)[:-1].cumsum()
+            sums = np.bincount(codes[:, f], weights = y, minlength = n_bins)[:-1].cumsum()
+            valid = np.flatnonzero((counts >= self.min_samples_leaf) & (n - counts >= self.min_samples_leaf))
+            if not len(valid):
+                continue
+            n_left, sum_left = counts[valid], sums[valid]
+            # Maximizing this minimizes the children's summed squared error
+            gain = sum_left ** 2 / n_left + (total - sum_left) ** 2 / (n - n_left)
+            i = gain.argmax()
+            if gain[i] > best_gain:
+                best_gain, best = gain[i], (f, valid[i])
+        return best
+
+    def fit(self, X, y):
+        # Bin numbers are stored as uint8
+        if not 2 <= self.max_bins <= 256:
+            raise ValueError('max_bins must be between 2 and 256, got {}'.format(self.max_bins))
+        X = np.asarray(X, dtype = np.float64)
+        y = np.asarray(y, dtype = np.float64)
+        self.n_features_ = X.shape[1]
+        self.bin_thresholds_ = [self._bin_thresholds(X[:, f]) for f in range(X.shape[1])]
+        codes = self._bin(X)
+
+        feature, threshold, left, right, value = [], [], [], [], []
+        depth_reached = 0
+        # Depth first, left child first, so nodes are numbered as in sklearn
+        stack = [(np.arange(len(y)), 0, -1, False)]
+        while stack:
+            rows, depth, parent, is_left = stack.pop()
+            node = len(value)
+            if parent >= 0:
+                (left if is_left else right)[parent] = node
+            y_node = y[rows]
+            value.append(y_node.mean())
+            feature.append(-2)
+            threshold.append(-2.)
+            left.append(-1)
+            right.append(-1)
+            depth_reached = max(depth_reached, depth)
+
+            if ((self.max_depth is not None and depth >= self.max_depth) or
+                    len(rows) < self.min_samples_split or len(rows) < 2 * self.min_samples_leaf or
+                    y_node.var() <= 1e-7):
+                continue
+            split = self._best_split(codes[rows], y_node)
+            if split is None:
+                continue
+            f, b = split
+            feature[node] = f
+            threshold[node] = self.bin_thresholds_[f][b]
+            go_left = codes[rows, f] <= b
+            stack.append((rows[~go_left], depth + 1, node, False))
+            stack.append((rows[go_left], depth + 1, node, True))
+
+        self.tree_ = Tree(feature, threshold, left, right, value, depth_reached)
+        return self
+
+    def apply(self, X):
+        return self.tree_.apply(np.asarray(X, dtype = np.float64))
+
+    def predict(self, X):
+        return self.tree_.value[self.apply(X), 0, 0]
@@ -0,0 +1,182 @@
+import os
+import sys
+import errno
+import hashlib
+import tempfile
+import cPickle as pickle
+import numpy as np
+import sklearn
+from sklearn.base import clone
+
+# Pickles and fits depend on these, so they are part of every key
+_versions = 'python {} numpy {} sklearn {}'.format(sys.version, np.__version__, sklearn.__version__)
+
+_sources = {}  # source file -> (mtime, size, SHA-1 of its contents)
+
+def code_version(obj):
+    """ Qualified name of a class or function and a hash of its module's source,
+        so that cached results go stale when the code that made them changes. """
+    name = '{}.{}'.format(obj.__module__, obj.__name__)
+    path = getattr(sys.modules.get(obj.__module__), '__file__', None)
+    if path is None:
+        return name
+    if path.endswith(('.pyc', '.pyo')):
+        path = path[:-1]
+    try:
+        st = os.stat(path)
+    except OSError:
+        return name
+    source = _sources.get(path)
+    if source is None or source[:2] != (st.st_mtime, st.st_size):
+        with open(path, 'rb') as f:
+            source = _sources[path] = (st.st_mtime, st.st_size, hashlib.sha1(f.read()).hexdigest())
+    return '{} {}'.format(name, source[2])
+
+class ModelCache(object):
+    """ On-disk cache of fitted estimators and scores.
+        Entries are keyed by a SHA-1 hash of everything that determines them:
+        the training (and scoring) rows, the estimator's class and parameters,
+        and any other key parts, and the Python, numpy and sklearn versions.
+        Classes and functions count with the source of their module (see
+        code_version), so editing an estimator or scorer invalidates its entries.
+        Files are written atomically, so several processes can share a cache.
+        When the cache grows past max_bytes, the least recently used entries
+        are removed. An entry that cannot be read counts as a miss; if the
+        directory cannot be written, nothing more is cached. """
+
+    def __init__(self, path, max_bytes = 100 * 2**20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = None  # bytes in the cache as of the last scan, plus entries written since
+        self.writable = True
+
+    def key(self, *parts):
+        """ Hash of arrays, estimators (class and parameters), functions and plain values. """
+        h = hashlib.sha1(_versions)
+        for part in parts:
+            if hasattr(part, 'get_params'):
+                params = sorted(part.get_params().items())
+                h.update(code_version(type(part)))
+                for name, value in params:
+                    if hasattr(value, 'get_params'):  # e.g. the trees of BaggedTreeRegressor
+                        h.update(code_version(type(value)))
+                h.update(repr(params))
+            elif callable(part) and hasattr(part, '__name__'):
+                h.update(code_version(part))
+            elif hasattr(part, 'shape') or isinstance(part, list):
+                a = np.ascontiguousarray(part)
+                h.update('{} {}'.format(a.dtype.str, a.shape))
+                h.update(a.view(np.uint8).data if a.size else '')
+            else:
+                h.update(repr(part))
+            h.update('\0')
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key, default = None):
+        filename = self.filename(key)
+        try:
+            f = open(filename, 'rb')
+        except IOError:
+            return default
+        try:
+            with f:
+                value = pickle.load(f)
+        except Exception:
+            # Truncated, corrupt or no longer loadable: drop it
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return default
+        try:
+            os.utime(filename, None)  # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        if not self.writable:
+            return
+        try:
+            size = self._write(key, value)
+            if self.size is None:
+                self.evict()
+            else:
+                self.size += size
+                if self.size > self.max_bytes:
+                    self.evict()
+        except (IOError, OSError):
+            self.writable = False  # e.g. installed read-only: go on without caching
+
+    def _write(self, key, value):
+        try:
+            os.makedirs(self.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file, then rename, so readers never see a partial entry
+        fd, tmp = tempfile.mkstemp(dir = self.path, suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.rename(tmp, self.filename(key))
+        except:
+            os.remove(tmp)
+            raise
+        return size
+
+    def evict(self):
+        """ Remove least recently used entries until the cache fits in max_bytes.
+            Scans the directory, so entries written by other processes are counted. """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pkl'):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue  # removed by another process
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+        self.size = total
+
+    def clear(self):
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+        self.size = None
+
+    def fit(self, estimator, X, y):
+        """ A copy of estimator fitted to [X, y], from the cache if it is there. """
+        key = self.key('fit', estimator, X, y)
+        model = self.get(key)
+        if model is None:
+            model = clone(estimator).fit(X, y)
+            self.put(key, model)
+        return model
+
+    def fit_and_score(self, estimator, X, y, train, test, scoring):
+        """ Train and test scores of estimator fitted on the train rows of [X, y]. """
+        X_train, y_train, X_test, y_test = X[train], y[train], X[test], y[test]
+        key = self.key('scores', estimator, X_train, y_train, X_test, y_test, scoring)
+        scores = self.get(key)
+        if scores is None:
+            model = self.fit(estimator, X_train, y_train)
+            scores = (scoring(y_train, model.predict(X_train)), scoring(y_test, model.predict(X_test)))
+            self.put(key, scores)
+        return scores
+
+
+# Cache used by boston_housing.py and visuals.py
+default_cache = ModelCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.model_cache'))
@@ -0,0 +1,78 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from sklearn.tree import DecisionTreeRegressor
+import boston_housing
+import model_cache
+from model_cache import ModelCache
+from hist_tree import HistogramTreeRegressor
+
+
+class HistogramTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.rand(1000, 2)
+        self.y = rng.rand(1000)
+
+    def test_max_bins_256(self):
+        reg = HistogramTreeRegressor(max_depth = 1, max_bins = 256).fit(self.X, self.y)
+        self.assertEqual(max(len(t) for t in reg.bin_thresholds_) + 1, 256)
+        self.assertEqual(reg._bin(self.X).max(), 255)
+
+    def test_max_bins_out_of_range(self):
+        for max_bins in (1, 257):
+            self.assertRaises(ValueError, HistogramTreeRegressor(max_bins = max_bins).fit, self.X, self.y)
+
+    def test_same_splits_as_sklearn(self):
+        # Fewer distinct values than max_bins: every split sklearn considers is a candidate
+        rng = np.random.RandomState(1)
+        X = rng.randint(0, 10, (300, 3)).astype(float)
+        y = X[:, 0] * 2 - X[:, 1] + rng.randn(300)
+        for max_depth in (1, 2, 4, 6, None):
+            reg = HistogramTreeRegressor(max_depth = max_depth).fit(X, y)
+            sk = DecisionTreeRegressor(max_depth = max_depth, random_state = 0).fit(X, y)
+            np.testing.assert_allclose(reg.predict(X), sk.predict(X))
+            self.assertEqual(reg.tree_.node_count, sk.tree_.node_count)
+            if max_depth is not None and max_depth <= 4:
+                # Shallow nodes still hold every value, so thresholds are the same too
+                X_test = rng.randint(-1, 11, (200, 3)).astype(float)
+                np.testing.assert_allclose(reg.predict(X_test), sk.predict(X_test))
+
+    def test_max_depth(self):
+        for max_depth in (1, 3, 5):
+            reg = HistogramTreeRegressor(max_depth = max_depth).fit(self.X, self.y)
+            self.assertEqual(reg.tree_.max_depth, max_depth)
+            self.assertTrue(len(np.unique(reg.predict(self.X))) <= 2 ** max_depth)
+
+    def test_min_samples_split(self):
+        reg = HistogramTreeRegressor(min_samples_split = 50).fit(self.X, self.y)
+        t = reg.tree_
+        internal = t.children_left != -1
+        sizes = np.bincount(reg.apply(self.X), minlength = t.node_count)
+        # Sizes of internal nodes, summed from their leaves
+        for node in reversed(np.flatnonzero(internal)):
+            sizes[node] = sizes[t.children_left[node]] + sizes[t.children_right[node]]
+        self.assertTrue(sizes[internal].min() >= 50)
+        self.assertEqual(sizes[0], len(self.y))
+
+    def test_fit_model(self):
+        # Searched over max_depth by fit_model, with fitted trees pickled in the cache
+        path = tempfile.mkdtemp()
+        default_cache = model_cache.default_cache
+        model_cache.default_cache = ModelCache(path)
+        try:
+            X, y = boston_housing.housing.features.values, boston_housing.housing.prices.values
+            for run in range(2):  # the second run loads the trees from the cache
+                reg = boston_housing.fit_model(X, y, estimator = HistogramTreeRegressor())
+                self.assertIsInstance(reg, HistogramTreeRegressor)
+                self.assertTrue(1 <= reg.max_depth <= 10)
+                self.assertTrue(boston_housing.performance_metric(y, reg.predict(X)) > .7)
+        finally:
+            model_cache.default_cache = default_cache
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
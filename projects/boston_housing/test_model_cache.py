@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from model_cache import ModelCache
+
+ESTIMATOR = '''
+import numpy as np
+from sklearn.base import BaseEstimator, RegressorMixin
+
+class MeanRegressor(BaseEstimator, RegressorMixin):
+    def fit(self, X, y):
+        self.mean_ = np.mean(y) + {}
+        return self
+
+    def predict(self, X):
+        return np.repeat(self.mean_, len(X))
+'''
+
+
+class ModelCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = ModelCache(os.path.join(self.path, 'cache'))
+        sys.path.insert(0, self.path)
+        self.X = np.arange(10.).reshape(5, 2)
+        self.y = np.arange(5.)
+
+    def tearDown(self):
+        sys.path.remove(self.path)
+        sys.modules.pop('mean_regressor', None)
+        shutil.rmtree(self.path)
+
+    def load_estimator(self, offset):
+        with open(os.path.join(self.path, 'mean_regressor.py'), 'w') as f:
+            f.write(ESTIMATOR.format(offset))
+        if os.path.exists(os.path.join(self.path, 'mean_regressor.pyc')):
+            os.remove(os.path.join(self.path, 'mean_regressor.pyc'))
+        sys.modules.pop('mean_regressor', None)
+        import mean_regressor
+        return mean_regressor.MeanRegressor()
+
+    def test_hit(self):
+        estimator = self.load_estimator(0)
+        self.assertEqual(self.cache.fit(estimator, self.X, self.y).mean_, 2.)
+        self.assertEqual(self.cache.get(self.cache.key('fit', estimator, self.X, self.y)).mean_, 2.)
+
+    def test_changed_estimator_misses(self):
+        estimator = self.load_estimator(0)
+        key = self.cache.key('fit', estimator, self.X, self.y)
+        self.assertEqual(self.cache.fit(estimator, self.X, self.y).mean_, 2.)
+
+        estimator = self.load_estimator(100)
+        self.assertNotEqual(self.cache.key('fit', estimator, self.X, self.y), key)
+        self.assertEqual(self.cache.fit(estimator, self.X, self.y).mean_, 102.)
+
+    def test_unreadable_entry_misses(self):
+        key = self.cache.key('scores', 1)
+        self.cache.put(key, (1., 2.))
+        with open(self.cache.filename(key), 'wb') as f:
+            f.write('not a pickle')
+        self.assertIsNone(self.cache.get(key))
+        self.assertFalse(os.path.exists(self.cache.filename(key)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,15 +5,17 @@ import warnings
 warnings.filterwarnings("ignore", category = UserWarning, module = "matplotlib")
 ###########################################
 
-import matplotlib.pyplot as pl
 import numpy as np
-import sklearn.learning_curve as curves
 from sklearn.tree import DecisionTreeRegressor
-from sklearn.cross_validation import ShuffleSplit, train_test_split
+from sklearn.cross_validation import ShuffleSplit
+from cv_engine import CVEngine
+from model_cache import default_cache
 
-def ModelLearning(X, y):
+def ModelLearning(X, y, estimator = None):
     """ Calculates the performance of several models with varying sizes of training data.
         The learning and testing scores for each model are then plotted. """
+    import matplotlib.pyplot as pl  # imported on first plot, it is slow to load
+    estimator = estimator if estimator is not None else DecisionTreeRegressor()
     
     # Create 10 cross-validation sets for training and testing
     cv = ShuffleSplit(X.shape[0], n_iter = 10, test_size = 0.2, random_state = 0)
@@ -24,15 +26,18 @@ def ModelLearning(X, y):
     # Create the figure window
     fig = pl.figure(figsize=(10,7))
 
-    # Create three different models based on max_depth
-    for k, depth in enumerate([1,3,6,10]):
-        
-        # Create a Decision tree regressor at max_depth = depth
-        regressor = DecisionTreeRegressor(max_depth = depth)
+    # Create four different models based on max_depth
+    depths = [1,3,6,10]
+
+    # Calculate the training and testing scores of all models at once, in parallel
+    engine = CVEngine(X, y, cache = default_cache)
+    try:
+        sizes, all_train_scores, all_test_scores = engine.depth_learning_curves(estimator, depths, cv, train_sizes)
+    finally:
+        engine.close()
 
-        # Calculate the training and testing scores
-        sizes, train_scores, test_scores = curves.learning_curve(regressor, X, y, \
-            cv = cv, train_sizes = train_sizes, scoring = 'r2')
+    for k, depth in enumerate(depths):
+        train_scores, test_scores = all_train_scores[k], all_test_scores[k]
         
         # Find the mean and standard deviation for smoothing
         train_std = np.std(train_scores, axis = 1)
@@ -63,9 +68,15 @@ def ModelLearning(X, y):
     fig.show()
 
 
-def ModelComplexity(X, y):
+def ModelComplexity(X, y, estimator = None, oob = False):
     """ Calculates the performance of the model as model complexity increases.
-        The learning and testing errors rates are then plotted. """
+        The learning and testing errors rates are then plotted.
+        With oob = True, the validation score is the out-of-bag score of a
+        single bagged ensemble instead of 10 cross-validation splits. """
+    if oob:
+        return BaggedModelComplexity(X, y, estimator)
+    import matplotlib.pyplot as pl
+    estimator = estimator if estimator is not None else DecisionTreeRegressor()
     
     # Create 10 cross-validation sets for training and testing
     cv = ShuffleSplit(X.shape[0], n_iter = 10, test_size = 0.2, random_state = 0)
@@ -73,9 +84,13 @@ def ModelComplexity(X, y):
     # Vary the max_depth parameter from 1 to 10
     max_depth = np.arange(1,11)
 
-    # Calculate the training and testing scores
-    train_scores, test_scores = curves.validation_curve(DecisionTreeRegressor(), X, y, \
-        param_name = "max_depth", param_range = max_depth, cv = cv, scoring = 'r2')
+    # Calculate the training and testing scores, in parallel
+    engine = CVEngine(X, y, cache = default_cache)
+    try:
+        train_scores, test_scores = engine.validation_curve(estimator, \
+            param_name = "max_depth", param_range = max_depth, cv = cv)
+    finally:
+        engine.close()
 
     # Find the mean and standard deviation for smoothing
     train_mean = np.mean(train_scores, axis=1)
@@ -101,26 +116,60 @@ def ModelComplexity(X, y):
     pl.show()
 
 
-def PredictTrials(X, y, fitter, data):
-    """ Performs trials of fitting and predicting data. """
+def BaggedModelComplexity(X, y, estimator = None, n_estimators = 100):
+    """ Training and out-of-bag scores of bagged trees as max_depth increases,
+        from one ensemble grown to the largest depth. """
+    import matplotlib.pyplot as pl
+    from bagging import BaggedTreeRegressor
 
-    # Store the predicted prices
-    prices = []
+    # Vary the max_depth parameter from 1 to 10
+    max_depth = np.arange(1,11)
 
-    for k in range(10):
-        # Split the data
-        X_train, X_test, y_train, y_test = train_test_split(X, y, \
-            test_size = 0.2, random_state = k)
-        
-        # Fit the data
-        reg = fitter(X_train, y_train)
-        
-        # Make a prediction
-        pred = reg.predict([data[0]])[0]
-        prices.append(pred)
-        
-        # Result
-        print "Trial {}: ${:,.2f}".format(k+1, pred)
+    bagged = BaggedTreeRegressor(n_estimators, max_depth = max_depth[-1], estimator = estimator).fit(X, y)
+    train_scores = [bagged.truncated(depth).score(X, y) for depth in max_depth]
+    oob_scores = bagged.oob_scores_[max_depth]
+
+    # Plot the validation curve
+    pl.figure(figsize=(7, 5))
+    pl.title('Bagged Decision Trees Complexity Performance')
+    pl.plot(max_depth, train_scores, 'o-', color = 'r', label = 'Training Score')
+    pl.plot(max_depth, oob_scores, 'o-', color = 'g', label = 'Out-of-Bag Score')
+
+    # Visual aesthetics
+    pl.legend(loc = 'lower right')
+    pl.xlabel('Maximum Depth')
+    pl.ylabel('Score')
+    pl.ylim([-0.05,1.05])
+    pl.show()
+
+
+def PredictTrials(X, y, fitter, data, trials = 10):
+    """ Performs trials of fitting and predicting data.
+        Returns the predicted prices, one row per trial and one column per client. """
+
+    # Fit one model per split of the data, in parallel
+    engine = CVEngine(X, y)
+    try:
+        models = engine.fit_trials(fitter, trials)
+    finally:
+        engine.close()
+
+    # Predict the prices of all clients at once with each model
+    data = np.asarray(data)
+    prices = np.array([reg.predict(data) for reg in models])
+
+    # Result
+    if trials <= 10:
+        for k in range(trials):
+            print "Trial {}: {}".format(k+1, ", ".join("${:,.2f}".format(p) for p in prices[k]))
 
     # Display price range
-    print "\nRange in prices: ${:,.2f}".format(max(prices) - min(prices))
\ No newline at end of file
+    ranges = np.ptp(prices, axis = 0)
+    if len(ranges) == 1:
+        print "\nRange in prices: ${:,.2f}".format(ranges[0])
+    else:
+        print
+        for i, r in enumerate(ranges):
+            print "Range in prices for client {}: ${:,.2f}".format(i+1, r)
+
+    return prices
\ No newline at end of file
@@ -1,9 +1,13 @@
 import random
-import math
 import heapq
 from environment import Agent, Environment
 from planner import RoutePlanner
 from simulator import Simulator
+from qtable import QTable
+from replay import ReplayBuffer, q_targets
+from schedules import Schedule
+from events import Step, Summary, OutcomeSink
+from instrument import Instrumentation
 from pprint import pprint 
 
 trials = 100
@@ -11,79 +15,69 @@ trials = 100
 class LearningAgent(Agent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__(self, env):
+    def __init__(self, env, replay=None, batch_size=32,
+            epsilon=Schedule('sqrt', 2), alpha=Schedule('sqrt', 10), gamma=.0, q=None):
         # Sets self.env = env, state = None, next_waypoint = None, default color
         super(LearningAgent, self).__init__(env)
         self.color = 'red'
         # simple route planner to get next_waypoint
         self.planner = RoutePlanner(self.env, self)
-        self.state = {}
 
         # Initialize any additional variables here
 
-        # Use our own state instead of self.state because of program crashing
-        self.q = {}
+        # Q values live in a dense table, which several agents may share;
+        # self.state holds the encoded row index
+        self.q = q if q is not None else QTable()
         self.old_state = None
         self.old_reward = .0
         self.alpha = .7
-        self.gamma = .0
+        self.gamma = gamma
         self.epsilon = .0
+        # Schedules for epsilon and alpha as functions of total steps taken
+        self.epsilon_schedule = epsilon
+        self.alpha_schedule = alpha
         self.random_count = 0
         self.steps_total = 1
         self.steps_trial = 0
         self.rewards = 0
 
+        # Optional experience replay: transitions are stored in self.replay and,
+        # if batch_size > 0, a random batch of them is learned from every step
+        self.replay = replay
+        self.batch_size = batch_size
+
     def reset(self, destination=None):
         self.planner.route_to(destination)
 
         # Prepare for a new trip; reset any variables here, if required
 
-        if self.steps_total == 1:
-            print 'STATS,Steps,Total,Random,Epsilon,Alpha,Gamma,Rewards' 
-        else:
-            print 'STATS,{:2},{:4},{:2},{:.2f},{:.2f},{:.2f},{:3}'.format(
-                    self.steps_trial, self.steps_total, self.random_count,
-                    self.epsilon, self.alpha, self.gamma, self.rewards)
+        # Only agents with trials of their own (see Environment.learners) report them
+        if self.steps_total > 1 and self in self.env.learners:
+            self.env.sink.emit(Summary(self.env.trial - 1, self.env.learners.index(self), self.steps_trial,
+                self.steps_total, self.random_count, self.epsilon, self.alpha, self.gamma, self.rewards))
 
         self.old_state = None
         self.old_reward = .0
         self.random_count = 0
         self.steps_trial = 0
         self.rewards = 0
-        self.epsilon = 2 / (2 + math.sqrt(self.steps_total))
-        self.alpha = 10 / (10 + math.sqrt(self.steps_total))
+        self.epsilon = self.epsilon_schedule(self.steps_total)
+        self.alpha = self.alpha_schedule(self.steps_total)
+
+    def get_state(self):
+        return self.q.decode(self.state) if self.state is not None else None
 
     def getAction(self, state):
-        action = None
-        max_v = None
-        # Use optimistic e-gready strategy. For unseen actions, set Q value between
-        # 2-10 (this problem only)
-        max_v_default = 5
-        
+        # Use optimistic e-gready strategy. Unseen actions get a Q value between
+        # 2-10 (this problem only), see QTable.default.
         if random.random() < self.epsilon:
             # Realistic e-gready.
             # Use suggested waypoint instead of completely random action.
-            action = state[4][1]
-            max_v = max_v_default
             self.random_count += 1
-        else:
-            for _action in self.env.valid_actions:
-                key = (state, _action)
-
-                if key in self.q:
-                    v = self.q[key]
-
-                    if max_v is None or v > max_v:
-                        max_v = v
-                        action = _action
-                else:
-                    # Explore new action in current state. Use optimistic e-gready
-                    # strategy by setting max long-term reward to above 0
-                    action = _action
-                    max_v = max_v_default
-                    break
+            return (self.q.action_codes[self.next_waypoint], self.q.default)
 
-        return (action, max_v)
+        # Explore new actions in current state first, otherwise pick the best one
+        return self.q.best(state)
 
     def update(self, t):
         # Gather inputs.
@@ -94,17 +88,14 @@ class LearningAgent(Agent):
         self.steps_total += 1
         self.steps_trial += 1
 
-        # Update state
-        state = (('oncoming', inputs['oncoming']),
-                ('left', inputs['left']),
-                ('right', inputs['right']),
-                ('light', inputs['light']),
-                ('next_waypoint', self.next_waypoint))
+        # Update state (encoded as a Q-table row index)
+        state = self.q.encode(inputs, self.next_waypoint)
         # Update state in GUI
         self.state = state
 
         # Select action according to your policy
-        action, max_v = self.getAction(state)
+        a, max_v = self.getAction(state)
+        action = self.q.actions[a]
 
         # Execute action and get reward
         reward = self.env.act(self, action)
@@ -113,42 +104,109 @@ class LearningAgent(Agent):
         # Learn policy based on state, action, reward
         if self.old_state is not None:
             # Q(s,a) = (1 - alpha) * Q(s,a) + alpha * (reward + gamma * Q(s',a'))
-            old_v = self.q.get(self.old_state, .0)
-            new_v = self.old_reward + self.gamma * max_v
-            self.q[self.old_state] = (1 - self.alpha) * old_v + self.alpha * new_v
+            old_s, old_a = self.old_state
+            self.q.update(old_s, old_a, self.old_reward + self.gamma * max_v, self.alpha)
+
+            if self.replay is not None:
+                self.replay.add(old_s, old_a, self.old_reward, state)
+                if self.batch_size and self.replay.size >= self.batch_size:
+                    states, actions, rewards, next_states = self.replay.sample(self.batch_size)
+                    self.q.update_batch(states, actions, q_targets(self.q, rewards, next_states, self.gamma), self.alpha)
 
         # Save current state
-        self.old_state = (state, action)
+        self.old_state = (state, a)
         self.old_reward = reward
 
-        print "deadline = {}, inputs = {}, waypoint = {}, action = {}, "\
-                "reward = {}".format(
-           deadline, inputs, self.next_waypoint, action, reward)  # [debug]
+        if self.env.sink.active:
+            self.env.sink.emit(Step(self.env.trial, t, deadline, inputs['light'], inputs['oncoming'],
+                inputs['left'], inputs['right'], self.next_waypoint, action, reward))
+
+class PolicyAgent(Agent):
+    """Drives by a fixed greedy policy compiled from a trained Q-table; no learning."""
 
-def run():
-    """Run the agent for a finite number of trials."""
+    def __init__(self, env, q):
+        super(PolicyAgent, self).__init__(env)
+        self.color = 'red'
+        self.planner = RoutePlanner(self.env, self)
+        self.q = q
+        self.policy = q.compile()
+
+    def reset(self, destination=None):
+        self.planner.route_to(destination)
+
+    def get_state(self):
+        return self.q.decode(self.state) if self.state is not None else None
+
+    def update(self, t):
+        self.next_waypoint = self.planner.next_waypoint()
+        self.state = self.q.encode(self.env.sense(self), self.next_waypoint)
+        self.env.act(self, self.q.actions[self.policy[self.state]])
+
+
+def evaluate(q, n_trials=1000):
+    """Success rate of the greedy policy of q over n_trials fresh trials."""
+    sink = OutcomeSink()
+    e = Environment(sink=sink)
+    a = e.create_agent(PolicyAgent, q)
+    e.set_primary_agent(a, enforce_deadline=True)
+    Simulator(e, update_delay=0, display=False).run(n_trials=n_trials)
+    return sum(sink.reached) / float(len(sink.reached))
+
+def run(sink=None, replay_size=None, transitions_file=None, n_learners=1, instrument_file=None, eval_trials=None):
+    """Run the agent for a finite number of trials.
+
+    Events go to sink (see events.py); by default they are printed to stdout
+    in the format read by stats.py. Use events.NullSink() for speed.
+    With replay_size, the agent also learns from batches drawn from a replay
+    buffer of that many transitions. With transitions_file, the transitions
+    are saved there for offline training (see replay.py): all of them, or
+    with replay_size, only the last replay_size.
+    With n_learners > 1, that many learning agents drive at once, each to its
+    own destination, all updating the same Q-table.
+    With instrument_file, timings of the hot paths and per-trial Q-table
+    statistics are saved there as JSON (see instrument.py).
+    With eval_trials, the learned policy is then evaluated, without learning,
+    over that many more trials, and its success rate printed.
+    """
 
     # Set up environment and agent
-    e = Environment()  # create environment (also adds some dummy traffic)
-    a = e.create_agent(LearningAgent)  # create agent
+    e = Environment(sink=sink)  # create environment (also adds some dummy traffic)
+    replay = None
+    if replay_size or transitions_file:
+        replay = ReplayBuffer(replay_size or None)  # None: keep every transition
+    a = e.create_agent(LearningAgent, replay=replay, batch_size=(32 if replay_size else 0))  # create agent
 
     # NOTE: You can set enforce_deadline=False while debugging to allow longer trials
     e.set_primary_agent(a, enforce_deadline=True)  # specify agent to track
+    for i in xrange(n_learners - 1):
+        e.add_learning_agent(e.create_agent(LearningAgent, replay=replay, batch_size=a.batch_size, q=a.q))
 
     # Now simulate it.
     # Create simulator (uses pygame when display=True, if available).
-    sim = Simulator(e, update_delay=.01, display=False)
+    instrument = Instrumentation() if instrument_file else None
+    sim = Simulator(e, update_delay=.01, display=False, instrument=instrument)
     # NOTE: To speed up simulation, reduce update_delay and/or set display=False
 
     sim.run(n_trials=trials)  # run for a specified number of trials
+    e.sink.close()
+    if transitions_file:
+        replay.save(transitions_file)
+        if replay.dropped:
+            print "run(): Only the last {} transitions were saved to {}; {} older ones did not fit in the replay buffer.".format(
+                replay.size, transitions_file, replay.dropped)
+    if instrument_file:
+        instrument.save(instrument_file)
 
     # NOTE: To quit midway, press Esc or close pygame window, or hit Ctrl+C on the
     # command-line
     
     # Print the final Q table.
     print '+'*100
-    pprint(a.q)
+    pprint(a.q.to_dict())
     print '+'*100
 
+    if eval_trials:
+        print 'Greedy policy reached the destination in {:.1%} of {} trials'.format(evaluate(a.q, eval_trials), eval_trials)
+
 if __name__ == '__main__':
     run()
@@ -0,0 +1,96 @@
+import argparse
+import importlib
+import timeit
+import numpy as np
+from environment import Environment
+from events import OutcomeSink
+from scenarios import make_corpus, save_corpus, load_corpus
+
+def timed(method, samples):
+    """Wrap a bound method so each call's duration (in seconds) is appended to samples."""
+    clock = timeit.default_timer
+
+    def wrapper(*args, **kwargs):
+        start = clock()
+        result = method(*args, **kwargs)
+        samples.append(clock() - start)
+        return result
+    return wrapper
+
+
+def benchmark(agent_class, grid_size, corpus, **agent_kwargs):
+    """Replay every scenario of the corpus with agent_class as the primary agent.
+
+    Returns a dict of throughput, sense/act latency percentiles (microseconds),
+    success rate and mean reward per trial.
+    """
+    sink = OutcomeSink()
+    env = Environment(num_dummies=len(corpus[0].dummies), sink=sink, grid_size=grid_size)
+    agent = env.create_agent(agent_class, **agent_kwargs)
+    env.set_primary_agent(agent, enforce_deadline=True)
+
+    sense_times, act_times = [], []
+    env.sense = timed(env.sense, sense_times)
+    act = env.act
+    rewards = []
+
+    def act_and_record(a, action):
+        reward = act(a, action)
+        if a is agent:
+            rewards[-1] += reward
+        return reward
+    env.act = timed(act_and_record, act_times)
+
+    steps = 0
+    elapsed = 0.
+    clock = timeit.default_timer
+    for scenario in corpus:
+        env.reset(scenario)
+        rewards.append(0.)
+        start = clock()
+        while not env.done:
+            env.step()
+            steps += 1
+        elapsed += clock() - start
+
+    sense_us = np.array(sense_times) * 1e6
+    act_us = np.array(act_times) * 1e6
+    return {
+        'trials': len(corpus),
+        'steps': steps,
+        'steps_per_sec': steps / elapsed,
+        'sense_us': dict(('p{}'.format(p), np.percentile(sense_us, p)) for p in (50, 90, 99)),
+        'act_us': dict(('p{}'.format(p), np.percentile(act_us, p)) for p in (50, 90, 99)),
+        'success': np.mean(sink.reached),
+        'reward': np.mean(rewards)}
+
+
+def load_class(name):
+    module, cls = name.rsplit('.', 1)
+    return getattr(importlib.import_module(module), cls)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record smartcab scenario corpora and benchmark agents on them.')
+    subparsers = parser.add_subparsers(dest='command')
+    record = subparsers.add_parser('record', help='generate a scenario corpus')
+    record.add_argument('corpus', help='output file (.npz)')
+    record.add_argument('--trials', type=int, default=100)
+    record.add_argument('--seed', type=int, default=0)
+    record.add_argument('--grid-size', type=int, nargs=2, default=[8, 6], metavar=('COLS', 'ROWS'))
+    record.add_argument('--dummies', type=int, default=3)
+    run = subparsers.add_parser('run', help='replay a corpus against an agent')
+    run.add_argument('corpus', help='file written by the record command')
+    run.add_argument('--agent', default='agent.LearningAgent', help='agent class as module.Class')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        save_corpus(args.corpus, make_corpus(args.trials, args.seed, args.grid_size, args.dummies), args.grid_size)
+        print 'Saved {} scenarios to {}'.format(args.trials, args.corpus)
+    else:
+        grid_size, corpus = load_corpus(args.corpus)
+        result = benchmark(load_class(args.agent), grid_size, corpus)
+        print 'Trials: {trials}, steps: {steps}, steps/sec: {steps_per_sec:.0f}'.format(**result)
+        for name in ('sense_us', 'act_us'):
+            print '{} latency (us): p50 {p50:.1f}, p90 {p90:.1f}, p99 {p99:.1f}'.format(name[:-3], **result[name])
+        print 'Success rate: {success:.2f}, mean reward: {reward:.2f}'.format(**result)
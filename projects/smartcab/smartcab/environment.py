@@ -1,8 +1,16 @@
 import time
 import random
-from collections import OrderedDict
+import numpy as np
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 
 from simulator import Simulator
+from events import PrintSink, NullSink, TrialStart, Reward, Outcome
+
+# Saved Environment state, see Environment.snapshot(). agents holds one
+# (location, heading, deadline, destination, finished, next_waypoint) tuple per
+# agent, in agent_states order; rng is the random module state, if captured.
+EnvironmentSnapshot = namedtuple('EnvironmentSnapshot', 't trial done status_text lights agents rng')
 
 class TrafficLight(object):
     """A traffic light that switches periodically."""
@@ -23,6 +31,178 @@ class TrafficLight(object):
             self.last_updated = t
 
 
+class TrafficLightGrid(object):
+    """The traffic lights of every intersection in a rectangular grid.
+
+    Light parameters are kept in flat NumPy arrays indexed by intersection
+    number, (x - x0) * rows + (y - y0), instead of one TrafficLight object per
+    intersection. Iterating over the grid yields (x, y) locations in that
+    order; grid[location] returns a TrafficLight-like view of one light.
+
+    Lights are not flipped one by one. update(t) is called for t = 0, 1, 2, ...
+    and a light flips whenever t reaches a multiple of its period, so its state
+    at clock t is derived as base ^ parity[period] ^ ((t // period) & 1), where
+    base is the initial state and parity holds the flips of earlier trials.
+    Advancing the clock is O(1); reset() folds the finished trial into parity,
+    one bit per distinct period.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.cols = bounds[2] - bounds[0] + 1
+        self.rows = bounds[3] - bounds[1] + 1
+        self.size = self.cols * self.rows
+
+        # Draw random parameters in the same order as creating a TrafficLight per intersection
+        state = np.empty(self.size, dtype=bool)
+        period = np.empty(self.size, dtype=np.int8)
+        for i in xrange(self.size):
+            state[i] = random.choice(TrafficLight.valid_states)
+            period[i] = random.choice([3, 4, 5])
+        self.base = state
+        self.period = period
+        self.parity = np.zeros(period.max() + 1, dtype=bool)
+        self.periods = set(int(p) for p in np.unique(period))
+        self.clock = 0  # t of the last update()
+        self.shared = False  # base and period are referenced by a snapshot
+
+    def index(self, location):
+        return (location[0] - self.bounds[0]) * self.rows + (location[1] - self.bounds[1])
+
+    def location(self, index):
+        return (self.bounds[0] + index // self.rows, self.bounds[1] + index % self.rows)
+
+    def random_location(self):
+        """Pick an intersection uniformly at random (same draw as random.choice over all locations)."""
+        return self.location(int(random.random() * self.size))
+
+    def neighbours(self, location):
+        """Adjacent intersections within bounds, in index order."""
+        x, y = location
+        if x > self.bounds[0]:
+            yield (x - 1, y)
+        if y > self.bounds[1]:
+            yield (x, y - 1)
+        if y < self.bounds[3]:
+            yield (x, y + 1)
+        if x < self.bounds[2]:
+            yield (x + 1, y)
+
+    def light_state(self, location):
+        """State of the light at location: True = NS open, False = EW open."""
+        i = (location[0] - self.bounds[0]) * self.rows + (location[1] - self.bounds[1])
+        p = self.period[i]
+        return bool(self.base[i] ^ self.parity[p] ^ ((self.clock // p) & 1))
+
+    def states(self):
+        """States of all lights, in index order."""
+        return self.base ^ self.parity[self.period] ^ ((self.clock // self.period) & 1).astype(bool)
+
+    def set_light(self, index, state=None, period=None):
+        """Change one light, keeping its current state unless a new one is given."""
+        if state is None:
+            state = self.states()[index]
+        if self.shared:
+            self.base, self.period = self.base.copy(), self.period.copy()
+            self.shared = False
+        if period is not None:
+            if period >= len(self.parity):
+                self.parity = np.append(self.parity, np.zeros(period + 1 - len(self.parity), dtype=bool))
+            self.period[index] = period
+            self.periods.add(period)
+        p = self.period[index]
+        self.base[index] = bool(state) ^ self.parity[p] ^ ((self.clock // p) & 1)
+
+    def load(self, states, periods):
+        """Set every light's state and period, as at the start of a trial."""
+        assert len(states) == self.size and len(periods) == self.size, "Light arrays do not match the grid!"
+        self.base = np.array(states, dtype=bool)
+        self.period = np.array(periods, dtype=np.int8)
+        self.parity = np.zeros(self.period.max() + 1, dtype=bool)
+        self.periods = set(int(p) for p in np.unique(self.period))
+        self.clock = 0
+        self.shared = False
+
+    def snapshot(self):
+        """Light parameters and clock; base and period are shared until changed."""
+        self.shared = True
+        return (self.base, self.period, self.parity.copy(), frozenset(self.periods), self.clock)
+
+    def restore(self, snapshot):
+        self.base, self.period, parity, periods, self.clock = snapshot
+        self.parity = parity.copy()
+        self.periods = set(periods)
+        self.shared = True
+
+    def reset(self):
+        for p in self.periods:
+            self.parity[p] ^= bool((self.clock // p) & 1)
+        self.clock = 0
+
+    def update(self, t):
+        self.clock = t
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, location):
+        return self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]
+
+    def __iter__(self):
+        for x in xrange(self.bounds[0], self.bounds[2] + 1):
+            for y in xrange(self.bounds[1], self.bounds[3] + 1):
+                yield (x, y)
+
+    def __getitem__(self, location):
+        if location not in self:
+            raise KeyError(location)
+        return TrafficLightView(self, self.index(location))
+
+    def keys(self):
+        return list(self)
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for i in xrange(self.size):
+            yield TrafficLightView(self, i)
+
+    def iteritems(self):
+        for i, location in enumerate(self):
+            yield location, TrafficLightView(self, i)
+
+
+class TrafficLightView(object):
+    """A single light of a TrafficLightGrid, with the attributes of a TrafficLight."""
+
+    __slots__ = ('grid', 'index')
+
+    def __init__(self, grid, index):
+        self.grid = grid
+        self.index = index
+
+    @property
+    def state(self):
+        return self.grid.light_state(self.grid.location(self.index))
+
+    @state.setter
+    def state(self, value):
+        self.grid.set_light(self.index, state=value)
+
+    @property
+    def period(self):
+        return int(self.grid.period[self.index])
+
+    @period.setter
+    def period(self, value):
+        self.grid.set_light(self.index, period=value)
+
+    @property
+    def last_updated(self):
+        return self.grid.clock // self.period * self.period
+
+
 class Environment(object):
     """Environment within which all agents operate."""
 
@@ -31,31 +211,24 @@ class Environment(object):
     valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
     hard_time_limit = -100  # even if enforce_deadline is False, end trial when deadline reaches this value (to avoid deadlocks)
 
-    def __init__(self, num_dummies=3):
+    def __init__(self, num_dummies=3, sink=None, grid_size=(8, 6)):
         self.num_dummies = num_dummies  # no. of dummy agents
+        self.sink = sink if sink is not None else PrintSink()  # receives trial/step events
         
         # Initialize simulation variables
         self.done = False
         self.t = 0
+        self.trial = -1  # incremented on every reset()
         self.agent_states = OrderedDict()
         self.status_text = ""
+        self.sense_cache = {}  # location -> {agent: inputs} sensed this tick, see sense()
 
         # Road network
-        self.grid_size = (8, 6)  # (cols, rows)
+        self.grid_size = tuple(grid_size)  # (cols, rows)
         self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
         self.block_size = 100
-        self.intersections = OrderedDict()
-        self.roads = []
-        for x in xrange(self.bounds[0], self.bounds[2] + 1):
-            for y in xrange(self.bounds[1], self.bounds[3] + 1):
-                self.intersections[(x, y)] = TrafficLight()  # a traffic light at each intersection
-
-        for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
-                    self.roads.append((a, b))
+        self.intersections = TrafficLightGrid(self.bounds)  # a traffic light at each intersection
+        self._roads = None  # built on first use, see roads
 
         # Dummy agents
         for i in xrange(self.num_dummies):
@@ -63,87 +236,151 @@ class Environment(object):
 
         # Primary agent and associated parameters
         self.primary_agent = None  # to be set explicitly
+        self.learners = []  # agents with their own destination and deadline; the primary agent comes first
         self.enforce_deadline = False
 
+    @property
+    def roads(self):
+        """(a, b) pairs of adjacent intersections, in both directions."""
+        if self._roads is None:
+            self._roads = [(a, b) for a in self.intersections for b in self.intersections.neighbours(a)]
+        return self._roads
+
     def create_agent(self, agent_class, *args, **kwargs):
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        self.agent_states[agent] = {'location': self.intersections.random_location(), 'heading': (0, 1), 'finished': False}
         return agent
 
     def set_primary_agent(self, agent, enforce_deadline=False):
         self.primary_agent = agent
+        self.learners = [agent] + [a for a in self.learners if a is not agent]
         self.enforce_deadline = enforce_deadline
 
-    def reset(self):
+    def add_learning_agent(self, agent):
+        """Give another agent its own destination and deadline every trial.
+
+        The trial ends when every such agent has reached its destination or run
+        out of time; agents that are done wait off the road until then.
+        """
+        if self.primary_agent is None:
+            self.primary_agent = agent
+        if agent not in self.learners:
+            self.learners.append(agent)
+
+    def reset(self, scenario=None):
+        """Start a new trial, either at random or as recorded in scenario (see scenarios.py)."""
         self.done = False
         self.t = 0
+        self.trial += 1
+        self.sense_cache.clear()
+
+        if scenario is not None:
+            # Replay recorded lights, route and traffic; reseed for identical runtime choices
+            random.seed(scenario.seed)
+            self.intersections.load(scenario.light_states, scenario.light_periods)
+            start, destination, start_heading = scenario.start, scenario.destination, scenario.heading
+            others = iter(scenario.dummies)
+        else:
+            # Reset traffic lights
+            self.intersections.reset()
 
-        # Reset traffic lights
-        for traffic_light in self.intersections.itervalues():
-            traffic_light.reset()
+            # Pick a start and a destination
+            start = self.intersections.random_location()
+            destination = self.intersections.random_location()
 
-        # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
+            # Ensure starting location and destination are not too close
+            while self.compute_dist(start, destination) < 4:
+                start = self.intersections.random_location()
+                destination = self.intersections.random_location()
 
-        # Ensure starting location and destination are not too close
-        while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
+            start_heading = random.choice(self.valid_headings)
 
-        start_heading = random.choice(self.valid_headings)
         deadline = self.compute_dist(start, destination) * 5
-        print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
+        self.sink.emit(TrialStart(self.trial, start[0], start[1], destination[0], destination[1], deadline))
+
+        # Routes of the other learning agents
+        routes = {}
+        if self.primary_agent is not None:
+            routes[self.primary_agent] = (start, start_heading, destination)
+        for agent in self.learners[1:]:
+            route = (self.intersections.random_location(), random.choice(self.valid_headings), self.intersections.random_location())
+            while self.compute_dist(route[0], route[2]) < 4:
+                route = (self.intersections.random_location(), route[1], self.intersections.random_location())
+            routes[agent] = route
 
         # Initialize agent(s)
         for agent in self.agent_states.iterkeys():
+            route = routes.get(agent)
+            if route is not None:
+                location, heading, agent_destination = route
+            elif scenario is not None:
+                location, heading, agent.next_waypoint = next(others)
+            else:
+                location, heading = self.intersections.random_location(), random.choice(self.valid_headings)
             self.agent_states[agent] = {
-                'location': start if agent is self.primary_agent else random.choice(self.intersections.keys()),
-                'heading': start_heading if agent is self.primary_agent else random.choice(self.valid_headings),
-                'destination': destination if agent is self.primary_agent else None,
-                'deadline': deadline if agent is self.primary_agent else None}
-            agent.reset(destination=(destination if agent is self.primary_agent else None))
+                'location': location,
+                'heading': heading,
+                'destination': agent_destination if route is not None else None,
+                'deadline': self.compute_dist(location, agent_destination) * 5 if route is not None else None,
+                'finished': False}
+            agent.reset(destination=(agent_destination if route is not None else None))
 
     def step(self):
         #print "Environment.step(): t = {}".format(self.t)  # [debug]
 
         # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
+        self.intersections.update(self.t)
+        self.sense_cache.clear()  # lights may have changed
 
-        # Update agents
-        for agent in self.agent_states.iterkeys():
-            agent.update(self.t)
+        # Update agents (learning agents that are done sit the trial out)
+        for agent, state in self.agent_states.iteritems():
+            if not state['finished']:
+                agent.update(self.t)
 
         if self.done:
-            return  # primary agent might have reached destination
+            return  # learning agents might have reached their destinations
 
-        if self.primary_agent is not None:
-            agent_deadline = self.agent_states[self.primary_agent]['deadline']
+        for agent in self.learners:
+            state = self.agent_states[agent]
+            if state['finished']:
+                continue
+            agent_deadline = state['deadline']
             if agent_deadline <= self.hard_time_limit:
-                self.done = True
-                print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
+                self.finish(agent, 'hard limit')
             elif self.enforce_deadline and agent_deadline <= 0:
-                self.done = True
-                print "Environment.step(): Primary agent ran out of time! Trial aborted."
-            self.agent_states[self.primary_agent]['deadline'] = agent_deadline - 1
+                self.finish(agent, 'ran out')
+            state['deadline'] = agent_deadline - 1
 
         self.t += 1
 
     def sense(self, agent):
+        """Inputs of agent at its intersection: light, and the waypoints of oncoming, left and right traffic.
+
+        Results are cached until something at the agent's intersection changes
+        (an agent arriving, leaving, finishing or changing its next_waypoint),
+        or the lights update. The returned dict is shared; do not modify it.
+        """
         assert agent in self.agent_states, "Unknown agent!"
 
         state = self.agent_states[agent]
         location = state['location']
+        cached = self.sense_cache.get(location)
+        if cached is None:
+            cached = self.sense_cache[location] = {}
+        else:
+            inputs = cached.get(agent)
+            if inputs is not None:
+                return inputs
+
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        light = 'green' if self.intersections.light_state(location) == (heading[1] != 0) else 'red'
 
         # Populate oncoming, left, right
         oncoming = None
         left = None
         right = None
         for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
+            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]) or other_state['finished']:
                 continue
             other_heading = other_agent.get_next_waypoint()
             if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
@@ -156,10 +393,29 @@ class Environment(object):
                 if left != 'forward':  # we don't want to override left == 'forward'
                     left = other_heading
 
-        return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        inputs = cached[agent] = {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        return inputs
+
+    def invalidate(self, location):
+        """Forget cached sense() results at location, after something there changed."""
+        self.sense_cache.pop(location, None)
+
+    def waypoint_changed(self, agent):
+        state = self.agent_states.get(agent)
+        if state is not None:
+            self.invalidate(state['location'])
 
     def get_deadline(self, agent):
-        return self.agent_states[agent]['deadline'] if agent is self.primary_agent else None
+        return self.agent_states[agent]['deadline']  # None for agents without a destination
+
+    def finish(self, agent, reason):
+        """Take a learning agent out of the trial; the trial is done once all of them are."""
+        state = self.agent_states[agent]
+        state['finished'] = True
+        self.invalidate(state['location'])
+        self.sink.emit(Outcome(self.trial, self.t, self.learners.index(agent), state['deadline'], reason == 'reached', reason))
+        if all(self.agent_states[a]['finished'] for a in self.learners):
+            self.done = True
 
     def act(self, agent, action):
         assert agent in self.agent_states, "Unknown agent!"
@@ -168,8 +424,8 @@ class Environment(object):
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
         inputs = self.sense(agent)
+        light = inputs['light']
 
         # Move agent if within bounds and obeys traffic rules
         reward = 0  # reward/penalty
@@ -195,6 +451,8 @@ class Environment(object):
                 location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
                             (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
                 #if self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]:  # bounded
+                self.invalidate(state['location'])
+                self.invalidate(location)
                 state['location'] = location
                 state['heading'] = heading
                 reward = 2.0 if action == agent.get_next_waypoint() else -0.5  # valid, but is it correct? (as per waypoint)
@@ -205,17 +463,66 @@ class Environment(object):
             # Invalid move
             reward = -1.0
 
+        if state['destination'] is not None and state['location'] == state['destination']:
+            # A learning agent has reached its destination
+            if state['deadline'] >= 0:
+                reward += 10  # bonus
+            self.finish(agent, 'reached')
+
         if agent is self.primary_agent:
-            if state['location'] == state['destination']:
-                if state['deadline'] >= 0:
-                    reward += 10  # bonus
-                self.done = True
-                print "Environment.act(): Primary agent has reached destination!"  # [debug]
+            if self.sink.active:
+                self.sink.emit(Reward(self.trial, self.t, state['location'][0], state['location'][1],
+                    state['heading'][0], state['heading'][1], action, reward))
             self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
             #print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)  # [debug]
 
         return reward
 
+    def snapshot(self, rng=False):
+        """Save the state of the trial in progress, to restore() later.
+
+        Captures the lights, every agent's location, heading, deadline,
+        destination and next_waypoint, and optionally the random module state.
+        Agents' own attributes (e.g. learned values) are not included.
+        """
+        agents = tuple((state['location'], state['heading'], state.get('deadline'), state.get('destination'), state['finished'], agent.next_waypoint)
+            for agent, state in self.agent_states.iteritems())
+        return EnvironmentSnapshot(self.t, self.trial, self.done, self.status_text, self.intersections.snapshot(), agents,
+            random.getstate() if rng else None)
+
+    def restore(self, snapshot):
+        """Return to a state saved by snapshot(); can be done any number of times."""
+        assert len(snapshot.agents) == len(self.agent_states), "Snapshot does not match the agents!"
+        self.t, self.trial, self.done, self.status_text = snapshot.t, snapshot.trial, snapshot.done, snapshot.status_text
+        self.intersections.restore(snapshot.lights)
+        for agent, (location, heading, deadline, destination, finished, next_waypoint) in zip(self.agent_states.keys(), snapshot.agents):
+            self.agent_states[agent] = {'location': location, 'heading': heading, 'deadline': deadline,
+                'destination': destination, 'finished': finished}
+            agent.next_waypoint = next_waypoint
+        if snapshot.rng is not None:
+            random.setstate(snapshot.rng)
+        self.sense_cache.clear()
+
+    @contextmanager
+    def fork(self, rng=True, quiet=True):
+        """Run a lookahead from the current state, which is restored afterwards.
+
+            with env.fork():
+                reward = env.act(agent, action)
+                env.step()
+
+        With quiet=True, events of the lookahead are not sent to the sink.
+        """
+        snapshot = self.snapshot(rng)
+        sink = self.sink
+        if quiet:
+            self.sink = NullSink()
+        try:
+            yield snapshot
+        finally:
+            self.sink = sink
+            self.restore(snapshot)
+
     def compute_dist(self, a, b):
         """L1 distance between two points."""
         return abs(b[0] - a[0]) + abs(b[1] - a[1])
@@ -227,9 +534,20 @@ class Agent(object):
     def __init__(self, env):
         self.env = env
         self.state = None
-        self.next_waypoint = None
+        self._next_waypoint = None
         self.color = 'cyan'
 
+    @property
+    def next_waypoint(self):
+        return self._next_waypoint
+
+    @next_waypoint.setter
+    def next_waypoint(self, value):
+        # Other agents at this intersection sense it, see Environment.sense()
+        if value != self._next_waypoint:
+            self._next_waypoint = value
+            self.env.waypoint_changed(self)
+
     def reset(self, destination=None):
         pass
 
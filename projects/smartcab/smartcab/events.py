@@ -0,0 +1,173 @@
+import csv
+import numpy as np
+from collections import namedtuple
+
+# Typed event records. Fields are flat scalars so they map onto CSV columns and
+# NumPy structured arrays without conversion.
+TrialStart = namedtuple('TrialStart', 'trial start_x start_y destination_x destination_y deadline')
+Step = namedtuple('Step', 'trial t deadline light oncoming left right waypoint action reward')
+Reward = namedtuple('Reward', 'trial t x y heading_x heading_y action reward')
+Outcome = namedtuple('Outcome', 'trial t agent deadline reached reason')  # agent: index among learning agents, 0 = primary
+Summary = namedtuple('Summary', 'trial agent steps total random epsilon alpha gamma rewards')  # agent: as in Outcome
+
+record_types = [TrialStart, Step, Reward, Outcome, Summary]
+
+# NumPy dtypes used by NpySink; action-like strings are stored with None as ''
+dtypes = {
+    'TrialStart': [('trial', 'i4'), ('start_x', 'i4'), ('start_y', 'i4'),
+        ('destination_x', 'i4'), ('destination_y', 'i4'), ('deadline', 'i4')],
+    'Step': [('trial', 'i4'), ('t', 'i4'), ('deadline', 'i4'), ('light', 'S5'),
+        ('oncoming', 'S7'), ('left', 'S7'), ('right', 'S7'), ('waypoint', 'S7'),
+        ('action', 'S7'), ('reward', 'f8')],
+    'Reward': [('trial', 'i4'), ('t', 'i4'), ('x', 'i4'), ('y', 'i4'),
+        ('heading_x', 'i4'), ('heading_y', 'i4'), ('action', 'S7'), ('reward', 'f8')],
+    'Outcome': [('trial', 'i4'), ('t', 'i4'), ('agent', 'i4'), ('deadline', 'i4'), ('reached', '?'), ('reason', 'S10')],
+    'Summary': [('trial', 'i4'), ('agent', 'i4'), ('steps', 'i4'), ('total', 'i4'), ('random', 'i4'),
+        ('epsilon', 'f8'), ('alpha', 'f8'), ('gamma', 'f8'), ('rewards', 'f8')]
+}
+
+
+class EventSink(object):
+    """Base class for event sinks. Receives typed records via emit()."""
+
+    active = True  # False if records are discarded, so callers can skip building them
+
+    def emit(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class NullSink(EventSink):
+    """Discards all events; the fastest option for training runs."""
+
+    active = False
+
+
+class OutcomeSink(NullSink):
+    """Discards events except trial outcomes, kept as a list of reached flags."""
+
+    def __init__(self):
+        self.reached = []
+
+    def emit(self, record):
+        if type(record) is Outcome:
+            self.reached.append(record.reached)
+
+
+class PrintSink(EventSink):
+    """Prints events in the classic stdout format understood by stats.py."""
+
+    def __init__(self):
+        self.header_printed = False
+
+    def emit(self, record):
+        kind = type(record)
+        if kind is Step:
+            inputs = {'light': record.light, 'oncoming': record.oncoming, 'left': record.left, 'right': record.right}
+            print "deadline = {}, inputs = {}, waypoint = {}, action = {}, "\
+                    "reward = {}".format(
+                record.deadline, inputs, record.waypoint, record.action, record.reward)
+        elif kind is Summary:
+            if not self.header_printed:
+                print 'STATS,Agent,Steps,Total,Random,Epsilon,Alpha,Gamma,Rewards'
+                self.header_printed = True
+            print 'STATS,{},{:2},{:4},{:2},{:.2f},{:.2f},{:.2f},{:3}'.format(
+                    record.agent, record.steps, record.total, record.random,
+                    record.epsilon, record.alpha, record.gamma, record.rewards)
+        elif kind is TrialStart:
+            print "Simulator.run(): Trial {}".format(record.trial)
+            print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(
+                (record.start_x, record.start_y), (record.destination_x, record.destination_y), record.deadline)
+        elif kind is Outcome:
+            who = 'Primary agent' if record.agent == 0 else 'Learning agent {}'.format(record.agent)
+            if record.reason == 'reached':
+                print "Environment.act(): {} has reached destination!".format(who)
+            elif record.reason == 'ran out':
+                print "Environment.step(): {} ran out of time! Trial aborted.".format(who)
+            else:
+                print "Environment.step(): {} hit hard time limit ({})! Trial aborted.".format(who, record.deadline)
+
+
+class BufferedSink(EventSink):
+    """Keeps records in memory, grouped by record type name.
+
+    Subclasses write the buffered records out in write(); once buffer_size
+    records have been collected, they are flushed and the buffers cleared.
+    With no subclass, records simply stay in self.records for inspection.
+    """
+
+    in_memory = True  # keep records instead of writing them out
+
+    def __init__(self, buffer_size=None):
+        self.buffer_size = buffer_size
+        self.records = dict((kind.__name__, []) for kind in record_types)
+        self.count = 0
+
+    def emit(self, record):
+        self.records[type(record).__name__].append(record)
+        self.count += 1
+        if self.buffer_size is not None and self.count >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.in_memory:
+            return
+        for name, rows in self.records.iteritems():
+            if rows:
+                self.write(name, rows)
+                del rows[:]
+        self.count = 0
+
+    def write(self, name, rows):
+        pass
+
+
+class CsvSink(BufferedSink):
+    """Appends records to one CSV file per record type: <prefix>_<Type>.csv."""
+
+    in_memory = False
+
+    def __init__(self, prefix, buffer_size=10000):
+        super(CsvSink, self).__init__(buffer_size)
+        self.prefix = prefix
+        self.started = set()
+
+    def write(self, name, rows):
+        path = '{}_{}.csv'.format(self.prefix, name)
+        with open(path, 'ab' if name in self.started else 'wb') as f:
+            writer = csv.writer(f)
+            if name not in self.started:
+                writer.writerow(rows[0]._fields)
+                self.started.add(name)
+            writer.writerows(rows)
+
+
+class NpySink(BufferedSink):
+    """Saves records as NumPy structured arrays: <prefix>_<Type>.npy.
+
+    Buffered rows are packed into compact arrays on every flush; the arrays are
+    concatenated and saved on close().
+    """
+
+    in_memory = False
+
+    def __init__(self, prefix, buffer_size=10000):
+        super(NpySink, self).__init__(buffer_size)
+        self.prefix = prefix
+        self.chunks = dict((kind.__name__, []) for kind in record_types)
+
+    def write(self, name, rows):
+        rows = [tuple('' if v is None else v for v in row) for row in rows]
+        self.chunks[name].append(np.array(rows, dtype=dtypes[name]))
+
+    def close(self):
+        self.flush()
+        for name, chunks in self.chunks.iteritems():
+            if chunks:
+                np.save('{}_{}.npy'.format(self.prefix, name), np.concatenate(chunks))
+                del chunks[:]
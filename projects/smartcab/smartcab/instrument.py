@@ -0,0 +1,116 @@
+import json
+import timeit
+import numpy as np
+
+class Timer(object):
+    """Call count and total time of one instrumented method."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.
+
+    def wrap(self, method):
+        clock = timeit.default_timer
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.total += clock() - start
+                self.calls += 1
+        return wrapper
+
+    def summary(self):
+        return {'calls': self.calls, 'total_s': self.total,
+                'mean_us': self.total / self.calls * 1e6 if self.calls else 0.}
+
+
+class Instrumentation(object):
+    """Opt-in counters and timers for the simulation hot paths.
+
+    attach() replaces methods on the environment and agent instances with timed
+    wrappers, so nothing is measured, and nothing costs anything, unless a
+    Simulator is created with instrument=Instrumentation(). Times are
+    inclusive: act() calls sense(), for instance, so that sense() call shows
+    up under both.
+
+    For agents with a Q-table (q attribute) it also records, per trial, the
+    number of distinct encoded states seen and how much the Q values changed.
+    """
+
+    def __init__(self):
+        self.timers = {}
+        self.trials = []
+        self.q_tables = []  # [QTable, values at trial start, states seen this trial]
+        self.trial = None
+
+    def timer(self, name):
+        if name not in self.timers:
+            self.timers[name] = Timer()
+        return self.timers[name]
+
+    def instrument(self, obj, method, name):
+        setattr(obj, method, self.timer(name).wrap(getattr(obj, method)))
+
+    def attach(self, env):
+        """Wrap the hot paths of env and its current agents."""
+        self.env = env
+        for method in ('step', 'sense', 'act'):
+            self.instrument(env, method, 'Environment.' + method)
+        self.instrument(env.intersections, 'update', 'TrafficLight.update')
+
+        for agent in env.agent_states:
+            kind = type(agent).__name__
+            self.instrument(agent, 'update', kind + '.update')
+            if hasattr(agent, 'getAction'):
+                self.instrument(agent, 'getAction', kind + '.getAction')
+            if hasattr(agent, 'planner'):
+                self.instrument(agent.planner, 'next_waypoint', 'RoutePlanner.next_waypoint')
+            q = getattr(agent, 'q', None)
+            if q is not None and all(q is not entry[0] for entry in self.q_tables):
+                self.q_tables.append([q, q.values.copy(), set()])
+                self.count_states(q, self.q_tables[-1][2])
+
+        reset = env.reset
+
+        def reset_and_start_trial(*args, **kwargs):
+            self.end_trial()
+            reset(*args, **kwargs)
+            self.trial = env.trial
+        env.reset = reset_and_start_trial
+
+    def count_states(self, q, states):
+        encode = q.encode
+
+        def encode_and_count(inputs, next_waypoint):
+            s = encode(inputs, next_waypoint)
+            states.add(s)
+            return s
+        q.encode = encode_and_count
+
+    def end_trial(self):
+        """Record Q-table statistics for the trial in progress, if any."""
+        if self.trial is None:
+            return
+        record = {'trial': self.trial, 'steps': self.env.t, 'q_states': 0, 'q_delta': 0., 'q_delta_max': 0.}
+        for entry in self.q_tables:
+            q, before, states = entry
+            delta = np.abs(q.values - before)
+            record['q_states'] += len(states)
+            record['q_delta'] += float(delta.sum())
+            record['q_delta_max'] = max(record['q_delta_max'], float(delta.max()))
+            entry[1] = q.values.copy()
+            states.clear()
+        self.trials.append(record)
+        self.trial = None
+
+    def summary(self):
+        """Timers by method name and per-trial Q-table statistics, as a dict."""
+        self.end_trial()
+        return {'timers': dict((name, timer.summary()) for name, timer in self.timers.iteritems()),
+                'trials': list(self.trials)}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
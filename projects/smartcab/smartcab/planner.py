@@ -1,38 +1,76 @@
-import random
+import numpy as np
+from environment import Environment
+
+# Next-hop tables shared by all planners, keyed by grid size (cols, rows)
+_next_hop_tables = {}
+
+headings = np.array(Environment.valid_headings)  # ENWS: a left turn is index + 1, a right turn index - 1
+heading_index = dict((h, i) for i, h in enumerate(Environment.valid_headings))
+
+
+def next_hop_table(cols, rows):
+    """Shortest-route next action for every (offset, heading) on a wrap-around grid.
+
+    The grid is a torus (see Environment.act), so the best move only depends on
+    the offset to the destination, ((dest_x - x) % cols, (dest_y - y) % rows),
+    and the current heading. The table holds Environment.valid_actions indices,
+    with None at the destination itself. Tables are built once per grid size
+    and shared by every planner.
+    """
+    key = (cols, rows)
+    if key not in _next_hop_tables:
+        _next_hop_tables[key] = _build_next_hop_table(cols, rows)
+    return _next_hop_tables[key]
+
+
+def _build_next_hop_table(cols, rows):
+    # Breadth-first search backwards from offset (0, 0), one level per iteration.
+    # An action turns first (forward: h, left: h + 1, right: h - 1), then moves
+    # one block along the new heading, which reduces the offset by that heading.
+    dist = np.full((cols, rows, 4), -1, dtype=np.int32)
+    dist[0, 0, :] = 0
+    x, y, h = np.zeros(4, dtype=int), np.zeros(4, dtype=int), np.arange(4)
+    d = 0
+    while len(h):
+        d += 1
+        px = np.tile((x + headings[h, 0]) % cols, 3)
+        py = np.tile((y + headings[h, 1]) % rows, 3)
+        ph = np.concatenate([h, (h - 1) % 4, (h + 1) % 4])  # reached h by forward, left, right
+        new = dist[px, py, ph] == -1
+        flat = np.unique(np.ravel_multi_index((px[new], py[new], ph[new]), dist.shape))
+        x, y, h = np.unravel_index(flat, dist.shape)
+        dist[x, y, h] = d
+
+    # Pick the action leading one step closer; ties prefer forward, then right (allowed on red)
+    X, Y, H = np.indices(dist.shape)
+    table = np.zeros(dist.shape, dtype=np.int8)
+    best = np.full(dist.shape, np.iinfo(np.int32).max, dtype=np.int32)
+    for action, turn in (('forward', 0), ('right', -1), ('left', 1)):
+        nh = (H + turn) % 4
+        nd = dist[(X - headings[nh, 0]) % cols, (Y - headings[nh, 1]) % rows, nh]
+        better = nd < best
+        table[better] = Environment.valid_actions.index(action)
+        best[better] = nd[better]
+    table[0, 0, :] = Environment.valid_actions.index(None)
+    return table
+
 
 class RoutePlanner(object):
-    """Silly route planner that is meant for a perpendicular grid network."""
+    """Shortest-route planner for the wrap-around grid network."""
 
     def __init__(self, env, agent):
         self.env = env
         self.agent = agent
         self.destination = None
+        self.table = next_hop_table(self.env.grid_size[0], self.env.grid_size[1])
 
     def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
-        print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
+        self.destination = destination if destination is not None else self.env.intersections.random_location()
+        #print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
 
     def next_waypoint(self):
         location = self.env.agent_states[self.agent]['location']
         heading = self.env.agent_states[self.agent]['heading']
-        delta = (self.destination[0] - location[0], self.destination[1] - location[1])
-        if delta[0] == 0 and delta[1] == 0:
-            return None
-        elif delta[0] != 0:  # EW difference
-            if delta[0] * heading[0] > 0:  # facing correct EW direction
-                return 'forward'
-            elif delta[0] * heading[0] < 0:  # facing opposite EW direction
-                return 'right'  # long U-turn
-            elif delta[0] * heading[1] > 0:
-                return 'left'
-            else:
-                return 'right'
-        elif delta[1] != 0:  # NS difference (turn logic is slightly different)
-            if delta[1] * heading[1] > 0:  # facing correct NS direction
-                return 'forward'
-            elif delta[1] * heading[1] < 0:  # facing opposite NS direction
-                return 'right'  # long U-turn
-            elif delta[1] * heading[0] > 0:
-                return 'right'
-            else:
-                return 'left'
+        offset = ((self.destination[0] - location[0]) % self.env.grid_size[0],
+                  (self.destination[1] - location[1]) % self.env.grid_size[1])
+        return Environment.valid_actions[self.table[offset[0], offset[1], heading_index[heading]]]
@@ -0,0 +1,130 @@
+import numpy as np
+from environment import Environment
+
+class QTable(object):
+    """Dense Q-table over integer-encoded states.
+
+    A state is the tuple of (name, value) pairs used by LearningAgent, e.g.
+    (('oncoming', None), ('left', 'forward'), ('right', None), ('light', 'red'),
+    ('next_waypoint', 'left')). Each value is mapped to a digit and the digits are
+    combined in mixed radix, so every state is a row of a small NumPy array and
+    every action a column.
+    """
+
+    actions = Environment.valid_actions
+    features = [
+        ('oncoming', Environment.valid_actions),
+        ('left', Environment.valid_actions),
+        ('right', Environment.valid_actions),
+        ('light', ['green', 'red']),
+        ('next_waypoint', Environment.valid_actions)]
+
+    def __init__(self, default=5.):
+        self.default = default  # value reported for actions never tried in a state
+
+        self.codes = [dict((v, i) for i, v in enumerate(values)) for _, values in self.features]
+        self.action_codes = dict((a, i) for i, a in enumerate(self.actions))
+        self.strides = []
+        n_states = 1
+        for _, values in reversed(self.features):
+            self.strides.insert(0, n_states)
+            n_states *= len(values)
+        self.n_states = n_states
+        self.n_actions = len(self.actions)
+
+        self.values = np.zeros((self.n_states, self.n_actions))
+        self.seen = np.zeros((self.n_states, self.n_actions), dtype=bool)
+
+    def encode(self, inputs, next_waypoint):
+        """Encode sensed inputs and the planner's waypoint as a row index."""
+        codes, strides = self.codes, self.strides
+        return (codes[0][inputs['oncoming']] * strides[0] +
+                codes[1][inputs['left']] * strides[1] +
+                codes[2][inputs['right']] * strides[2] +
+                codes[3][inputs['light']] * strides[3] +
+                codes[4][next_waypoint])
+
+    def encode_state(self, state):
+        """Encode a state tuple of (name, value) pairs as a row index."""
+        return sum(self.codes[i][value] * self.strides[i] for i, (_, value) in enumerate(state))
+
+    def decode(self, index):
+        """Decode a row index back into a state tuple."""
+        state = []
+        for i, (name, values) in enumerate(self.features):
+            state.append((name, values[(index // self.strides[i]) % len(values)]))
+        return tuple(state)
+
+    def best(self, s):
+        """Return (action index, value) of the greedy choice in state s.
+
+        Actions that were never tried win first, in valid_actions order, and are
+        reported with the optimistic default value.
+        """
+        unseen = ~self.seen[s]
+        if unseen.any():
+            return unseen.argmax(), self.default
+        row = self.values[s]
+        a = row.argmax()
+        return a, row[a]
+
+    def update(self, s, a, target, alpha):
+        """Move Q(s, a) towards target by learning rate alpha."""
+        self.values[s, a] = (1 - alpha) * self.values[s, a] + alpha * target
+        self.seen[s, a] = True
+
+    def max_values(self, states):
+        """Vectorized value of the greedy choice for an array of states (see best())."""
+        unseen = ~self.seen[states]
+        return np.where(unseen.any(axis=1), self.default, self.values[states].max(axis=1))
+
+    def update_batch(self, states, actions, targets, alpha):
+        """Move Q towards targets for arrays of (state, action) pairs.
+
+        Repeated pairs in one batch move towards the mean of their targets,
+        as a single update would.
+        """
+        flat = states * self.n_actions + actions
+        counts = np.bincount(flat, minlength=self.values.size)
+        values = self.values.reshape(-1)
+        np.add.at(values, flat, alpha * (targets - values[flat]) / counts[flat])
+        self.seen.reshape(-1)[flat] = True
+
+    def compile(self):
+        """Greedy policy as an int8 array of action indices, one per state.
+
+        Picks the best of the actions tried in each state; states where no
+        action was tried follow their next_waypoint.
+        """
+        waypoint = (np.arange(self.n_states) // self.strides[-1]) % len(self.features[-1][1])
+        values = np.where(self.seen, self.values, -np.inf)
+        policy = np.where(self.seen.any(axis=1), values.argmax(axis=1), waypoint)
+        return policy.astype(np.int8)
+
+    def save(self, path):
+        np.savez(path, values=self.values, seen=self.seen, default=self.default)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        table = cls(default=float(data['default']))
+        table.values[:] = data['values']
+        table.seen[:] = data['seen']
+        return table
+
+    def to_dict(self):
+        """Return the learned entries as {(state, action): value}."""
+        q = {}
+        for s, a in zip(*np.nonzero(self.seen)):
+            q[(self.decode(s), self.actions[a])] = float(self.values[s, a])
+        return q
+
+    @classmethod
+    def from_dict(cls, q, default=5.):
+        """Build a table from {(state, action): value} entries."""
+        table = cls(default=default)
+        for (state, action), v in q.iteritems():
+            s, a = table.encode_state(state), table.action_codes[action]
+            table.values[s, a] = v
+            table.seen[s, a] = True
+        return table
@@ -0,0 +1,113 @@
+import argparse
+import numpy as np
+from qtable import QTable
+
+class ReplayBuffer(object):
+    """Ring buffer of (state, action, reward, next state) transitions.
+
+    States and actions are QTable row and column indices, stored in flat NumPy
+    arrays. Once full, the oldest transitions are overwritten and counted in
+    self.dropped. With capacity=None, the arrays grow instead and every
+    transition is kept.
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        n = capacity if capacity is not None else 1024
+        self.states = np.zeros(n, dtype=np.int32)
+        self.actions = np.zeros(n, dtype=np.int8)
+        self.rewards = np.zeros(n)
+        self.next_states = np.zeros(n, dtype=np.int32)
+        self.size = 0
+        self.pos = 0
+        self.dropped = 0
+
+    def add(self, s, a, reward, s_next):
+        n = len(self.states)
+        if self.size == n:
+            if self.capacity is None:
+                self.grow()
+                n = len(self.states)
+            else:
+                self.dropped += 1
+        i = self.pos
+        self.states[i] = s
+        self.actions[i] = a
+        self.rewards[i] = reward
+        self.next_states[i] = s_next
+        self.pos = (i + 1) % n
+        self.size = min(self.size + 1, n)
+
+    def grow(self):
+        """Double the arrays of an unbounded buffer; it never wraps, so order is kept."""
+        for name in ('states', 'actions', 'rewards', 'next_states'):
+            a = getattr(self, name)
+            setattr(self, name, np.concatenate([a, np.zeros_like(a)]))
+        self.pos = self.size
+
+    def sample(self, batch_size):
+        """Random batch (with replacement) as (states, actions, rewards, next_states)."""
+        i = np.random.randint(0, self.size, batch_size)
+        return self.states[i], self.actions[i], self.rewards[i], self.next_states[i]
+
+    def transitions(self):
+        """All stored transitions, oldest first."""
+        n = len(self.states)
+        i = (np.arange(self.size) + (self.pos if self.size == n else 0)) % n
+        return self.states[i], self.actions[i], self.rewards[i], self.next_states[i]
+
+    def save(self, path):
+        states, actions, rewards, next_states = self.transitions()
+        np.savez(path, states=states, actions=actions, rewards=rewards, next_states=next_states)
+
+    @classmethod
+    def load(cls, paths, capacity=None):
+        """Load and concatenate transition files written by save()."""
+        data = [np.load(path) for path in paths]
+        columns = [np.concatenate([d[k] for d in data]) for k in ('states', 'actions', 'rewards', 'next_states')]
+        n = len(columns[0])
+        buf = cls(capacity if capacity is not None else max(n, 1))
+        keep = slice(max(0, n - buf.capacity), n)  # newest transitions if capacity is smaller
+        m = n - keep.start
+        buf.states[:m], buf.actions[:m], buf.rewards[:m], buf.next_states[:m] = [c[keep] for c in columns]
+        buf.size = m
+        buf.pos = m % buf.capacity
+        buf.dropped = keep.start
+        return buf
+
+
+def q_targets(q, rewards, next_states, gamma):
+    """reward + gamma * max_a' Q(s', a') for a batch of transitions."""
+    if gamma == 0:
+        return rewards
+    return rewards + gamma * q.max_values(next_states)
+
+
+def train_offline(paths, epochs=10, batch_size=64, alpha=.1, gamma=0., q=None):
+    """Train a Q-table from recorded transition files, without an Environment.
+
+    Each epoch visits every transition once, in shuffled batches.
+    """
+    q = q if q is not None else QTable()
+    states, actions, rewards, next_states = ReplayBuffer.load(paths).transitions()
+    for epoch in xrange(epochs):
+        order = np.random.permutation(len(states))
+        for start in xrange(0, len(order), batch_size):
+            i = order[start:start + batch_size]
+            q.update_batch(states[i], actions[i], q_targets(q, rewards[i], next_states[i], gamma), alpha)
+    return q
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train a Q-table offline from recorded smartcab transitions.')
+    parser.add_argument('transitions', nargs='+', help='.npz files written by ReplayBuffer.save()')
+    parser.add_argument('--out', required=True, help='where to save the Q-table (.npz)')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--alpha', type=float, default=.1)
+    parser.add_argument('--gamma', type=float, default=0.)
+    args = parser.parse_args()
+
+    q = train_offline(args.transitions, args.epochs, args.batch_size, args.alpha, args.gamma)
+    q.save(args.out)
+    print 'Learned {} Q values, saved to {}'.format(q.seen.sum(), args.out)
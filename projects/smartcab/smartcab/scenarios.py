@@ -0,0 +1,68 @@
+import numpy as np
+from collections import namedtuple
+from environment import Environment
+
+# A recorded trial set-up, replayed by Environment.reset(scenario).
+# dummies holds (location, heading, next_waypoint) for each non-primary agent, in
+# creation order; seed reseeds `random` so runtime choices repeat as well.
+Scenario = namedtuple('Scenario', 'seed start destination heading light_states light_periods dummies')
+
+
+def make_corpus(n, seed=0, grid_size=(8, 6), num_dummies=3):
+    """Generate n scenarios with the same distributions Environment.reset() uses."""
+    rs = np.random.RandomState(seed)
+    cols, rows = grid_size
+    headings = Environment.valid_headings
+    waypoints = Environment.valid_actions[1:]
+
+    def location():
+        return (int(rs.randint(1, cols + 1)), int(rs.randint(1, rows + 1)))
+
+    corpus = []
+    for i in xrange(n):
+        start, destination = location(), location()
+        while abs(start[0] - destination[0]) + abs(start[1] - destination[1]) < 4:
+            start, destination = location(), location()
+        corpus.append(Scenario(
+            seed=int(rs.randint(2 ** 31)),
+            start=start,
+            destination=destination,
+            heading=headings[rs.randint(4)],
+            light_states=rs.randint(2, size=cols * rows).astype(bool),
+            light_periods=rs.randint(3, 6, size=cols * rows).astype(np.int8),
+            dummies=[(location(), headings[rs.randint(4)], waypoints[rs.randint(3)]) for _ in xrange(num_dummies)]))
+    return corpus
+
+
+def save_corpus(path, corpus, grid_size):
+    headings = Environment.valid_headings
+    n, n_dummies = len(corpus), len(corpus[0].dummies) if corpus else 0
+    np.savez_compressed(path,
+        grid_size=np.array(grid_size),
+        seeds=np.array([s.seed for s in corpus], dtype=np.int64),
+        starts=np.array([s.start for s in corpus], dtype=np.int32),
+        destinations=np.array([s.destination for s in corpus], dtype=np.int32),
+        headings=np.array([headings.index(s.heading) for s in corpus], dtype=np.int8),
+        light_states=np.array([s.light_states for s in corpus], dtype=bool),
+        light_periods=np.array([s.light_periods for s in corpus], dtype=np.int8),
+        dummy_locations=np.array([[d[0] for d in s.dummies] for s in corpus], dtype=np.int32).reshape(n, n_dummies, 2),
+        dummy_headings=np.array([[headings.index(d[1]) for d in s.dummies] for s in corpus], dtype=np.int8).reshape(n, n_dummies),
+        dummy_waypoints=np.array([[Environment.valid_actions.index(d[2]) for d in s.dummies] for s in corpus], dtype=np.int8).reshape(n, n_dummies))
+
+
+def load_corpus(path):
+    """Returns (grid_size, list of scenarios)."""
+    data = np.load(path)
+    headings = Environment.valid_headings
+    corpus = []
+    for i in xrange(len(data['seeds'])):
+        corpus.append(Scenario(
+            seed=int(data['seeds'][i]),
+            start=tuple(int(v) for v in data['starts'][i]),
+            destination=tuple(int(v) for v in data['destinations'][i]),
+            heading=headings[data['headings'][i]],
+            light_states=data['light_states'][i],
+            light_periods=data['light_periods'][i],
+            dummies=[(tuple(int(v) for v in location), headings[h], Environment.valid_actions[w])
+                for location, h, w in zip(data['dummy_locations'][i], data['dummy_headings'][i], data['dummy_waypoints'][i])]))
+    return tuple(int(v) for v in data['grid_size']), corpus
@@ -0,0 +1,39 @@
+import math
+
+class Schedule(object):
+    """Decaying parameter schedule c / (c + f(steps)), e.g. for epsilon or alpha.
+
+    Families: 'sqrt' (f = sqrt), 'linear' (f = identity), 'log' (f = log) and
+    'constant' (always c, so keep c <= 1 for alpha). Only the family name and
+    constant are stored, so schedules can be pickled and sent to worker processes;
+    schedules with the same family and constant compare equal.
+    """
+
+    families = ['sqrt', 'linear', 'log', 'constant']
+
+    def __init__(self, family, c):
+        assert family in self.families, "Unknown schedule family!"
+        self.family = family
+        self.c = c
+
+    def __call__(self, steps):
+        c = self.c
+        if self.family == 'sqrt':
+            return c / (c + math.sqrt(steps))
+        elif self.family == 'linear':
+            return c / (c + float(steps))
+        elif self.family == 'log':
+            return c / (c + math.log(steps))
+        return c
+
+    def __eq__(self, other):
+        return isinstance(other, Schedule) and (self.family, self.c) == (other.family, other.c)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.family, self.c))
+
+    def __repr__(self):
+        return '{}({})'.format(self.family, self.c)
@@ -1,12 +1,26 @@
 import os
+import sys
 import time
 import random
 import importlib
+import threading
+from collections import namedtuple
+import numpy as np
+
+# Immutable copy of what Simulator.render() draws: agents is a tuple of
+# (agent, location, heading, destination, next_waypoint), lights an array of
+# light states in intersection index order.
+Snapshot = namedtuple('Snapshot', 't agents lights status_text')
 
 class Simulator(object):
     """Simulates agents in a dynamic smartcab environment.
 
-    Uses PyGame to display GUI, if available.
+    Uses PyGame to display GUI, if available. With threaded=True, the
+    environment is stepped on a background thread, which publishes snapshots
+    for the GUI to draw at frame_rate, so displaying does not slow it down.
+
+    With instrument=Instrumentation() (see instrument.py), the hot paths are
+    timed and run() returns the summary dict.
     """
 
     colors = {
@@ -21,7 +35,7 @@ class Simulator(object):
         'orange'  : (255, 128,   0)
     }
 
-    def __init__(self, env, size=None, update_delay=1.0, display=True):
+    def __init__(self, env, size=None, update_delay=1.0, display=True, threaded=False, frame_rate=30, instrument=None):
         self.env = env
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 1) * self.env.block_size)
         self.width, self.height = self.size
@@ -35,6 +49,11 @@ class Simulator(object):
         self.current_time = 0.0
         self.last_updated = 0.0
         self.update_delay = update_delay  # duration between each step (in secs)
+        self.threaded = threaded
+        self.snapshot = None  # latest published Snapshot (threaded mode)
+        self.instrument = instrument
+        if self.instrument is not None:
+            self.instrument.attach(self.env)
 
         self.display = display
         if self.display:
@@ -44,13 +63,23 @@ class Simulator(object):
                 self.screen = self.pygame.display.set_mode(self.size)
 
                 self.frame_delay = max(1, int(self.update_delay * 1000))  # delay between GUI frames in ms (min: 1)
+                if self.threaded:
+                    self.frame_delay = max(1, int(1000 / frame_rate))
                 self.agent_sprite_size = (32, 32)
                 self.agent_circle_radius = 10  # radius of circle, when using simple representation
                 for agent in self.env.agent_states:
                     agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
                     agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
+                    # Rotated sprites, one per heading (sprite image faces east)
+                    agent._sprites = dict((heading, agent._sprite if heading == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if heading[0] == -1 else heading[1] * -90))
+                        for heading in self.env.valid_headings)
 
                 self.font = self.pygame.font.Font(None, 28)
+                self.text_cache = {}  # (text, color) -> rendered surface
+                self.background = None  # roads and intersections, rendered on first frame
+                self.light_states = None  # traffic light states last drawn, in intersection index order
+                self.visible_lights = None  # which lights are (partly) on screen, same order
+                self.dirty_rects = []  # areas drawn over in the last frame, restored from background next frame
                 self.paused = False
             except ImportError as e:
                 self.display = False
@@ -60,9 +89,12 @@ class Simulator(object):
                 print "Simulator.__init__(): Error initializing GUI objects; display disabled.\n{}: {}".format(e.__class__.__name__, e)
 
     def run(self, n_trials=1):
+        if self.display and self.threaded:
+            return self.run_threaded(n_trials)
+
         self.quit = False
         for trial in xrange(n_trials):
-            print "Simulator.run(): Trial {}".format(trial)  # [debug]
+            #print "Simulator.run(): Trial {}".format(trial)  # [debug], see events.PrintSink
             self.env.reset()
             self.current_time = 0.0
             self.last_updated = 0.0
@@ -75,17 +107,7 @@ class Simulator(object):
 
                     # Handle GUI events
                     if self.display:
-                        for event in self.pygame.event.get():
-                            if event.type == self.pygame.QUIT:
-                                self.quit = True
-                            elif event.type == self.pygame.KEYDOWN:
-                                if event.key == 27:  # Esc
-                                    self.quit = True
-                                elif event.unicode == u' ':
-                                    self.paused = True
-
-                        if self.paused:
-                            self.pause()
+                        self.handle_events()
 
                     # Update environment
                     if self.current_time - self.last_updated >= self.update_delay:
@@ -105,57 +127,191 @@ class Simulator(object):
             if self.quit:
                 break
 
-    def render(self):
-        # Clear screen
-        self.screen.fill(self.bg_color)
+        self.env.sink.flush()
+        if self.instrument is not None:
+            return self.instrument.summary()
+
+    def run_threaded(self, n_trials=1):
+        """Step the environment on a background thread while this thread draws snapshots."""
+        self.quit = False
+        self.snapshot = None
+        errors = []
+
+        def simulate():
+            try:
+                next_snapshot = 0.0
+                for trial in xrange(n_trials):
+                    self.env.reset()
+                    last_updated = 0.0
+                    while not (self.quit or self.env.done):
+                        if self.paused:
+                            time.sleep(.01)
+                            continue
+                        now = time.time()
+                        if now - last_updated >= self.update_delay:
+                            self.env.step()
+                            last_updated = now
+                        if now >= next_snapshot:
+                            # Publish at most one snapshot per frame
+                            self.snapshot = self.take_snapshot()
+                            next_snapshot = now + self.frame_delay / 1000.
+                        # Wait for the next step or snapshot, whichever is due first
+                        time.sleep(max(0.0, min(last_updated + self.update_delay, next_snapshot) - time.time()))
+                    if self.quit:
+                        break
+            except Exception:
+                errors.append(sys.exc_info())
+                self.quit = True
 
-        # Draw elements
-        # * Static elements
+        simulation = threading.Thread(target=simulate, name='Simulator.run')
+        simulation.daemon = True
+        simulation.start()
+        try:
+            while simulation.is_alive():
+                self.handle_events()
+                snapshot = self.snapshot
+                if snapshot is not None:
+                    self.render(snapshot)
+                self.pygame.time.wait(self.frame_delay)
+        except KeyboardInterrupt:
+            self.quit = True
+        simulation.join()
+
+        self.env.sink.flush()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+        if self.instrument is not None:
+            return self.instrument.summary()
+
+    def handle_events(self):
+        for event in self.pygame.event.get():
+            if event.type == self.pygame.QUIT:
+                self.quit = True
+            elif event.type == self.pygame.KEYDOWN:
+                if event.key == 27:  # Esc
+                    self.quit = True
+                elif event.unicode == u' ':
+                    self.paused = True
+
+        if self.paused:
+            self.pause()
+
+    def take_snapshot(self):
+        """Copy the state render() needs, so it can be drawn while the environment moves on."""
+        agents = tuple((agent, state['location'], state['heading'], state.get('destination'), agent.get_next_waypoint())
+            for agent, state in self.env.agent_states.items())
+        lights = self.env.intersections.states()
+        lights.flags.writeable = False
+        return Snapshot(self.env.t, agents, lights, self.env.status_text)
+
+    def render(self, snapshot=None):
+        if snapshot is None:
+            snapshot = self.take_snapshot()
+        if self.background is None:
+            # First frame: pre-render static elements once and show everything
+            self.background = self.render_background()
+            self.screen.blit(self.background, (0, 0))
+            lights = self.env.intersections
+            x, y = np.divmod(np.arange(len(lights)), lights.rows)
+            x = (x + lights.bounds[0]) * self.env.block_size
+            y = (y + lights.bounds[1]) * self.env.block_size
+            self.visible_lights = (x + 18 >= 0) & (x - 18 < self.width) & (y + 18 >= 0) & (y - 18 < self.height)
+            for i in np.flatnonzero(self.visible_lights):
+                self.draw_light(lights.location(i), snapshot.lights[i])
+            self.light_states = snapshot.lights
+            self.dirty_rects = []
+            self.draw_dynamic(snapshot)
+            self.pygame.display.flip()
+            return
+
+        # Restore the background wherever the last frame drew dynamic elements
+        erased = self.dirty_rects
+        for rect in erased:
+            self.screen.blit(self.background, rect, rect)
+        updated = list(erased)
+
+        # * Traffic lights: redraw visible ones that switched or were under an erased area
+        lights = self.env.intersections
+        block_size = self.env.block_size
+        bounds = lights.bounds
+        redraw = snapshot.lights != self.light_states
+        grid = redraw.reshape(lights.cols, lights.rows)  # view, indexed [x - x0, y - y0]
+        for rect in erased:
+            x0, x1 = max(bounds[0], (rect.left - 18) // block_size), min(bounds[2], (rect.right + 18) // block_size)
+            y0, y1 = max(bounds[1], (rect.top - 18) // block_size), min(bounds[3], (rect.bottom + 18) // block_size)
+            if x0 <= x1 and y0 <= y1:
+                grid[x0 - bounds[0]:x1 - bounds[0] + 1, y0 - bounds[1]:y1 - bounds[1] + 1] = True
+        for i in np.flatnonzero(redraw & self.visible_lights):
+            updated.append(self.draw_light(lights.location(i), snapshot.lights[i]))
+        self.light_states = snapshot.lights
+
+        # * Dynamic elements and overlays
+        self.dirty_rects = []
+        self.draw_dynamic(snapshot)
+        updated.extend(self.dirty_rects)
+
+        # Push changed areas only
+        self.pygame.display.update(updated)
+
+    def render_background(self):
+        """Draw roads and intersections on a surface of their own."""
+        background = self.pygame.Surface(self.size).convert()
+        background.fill(self.bg_color)
         for road in self.env.roads:
-            self.pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
-
-        for intersection, traffic_light in self.env.intersections.iteritems():
-            self.pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
-            if traffic_light.state:  # North-South is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
-            else:  # East-West is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
-                    (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
-
-        # * Dynamic elements
-        for agent, state in self.env.agent_states.iteritems():
+            self.pygame.draw.line(background, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+        for intersection in self.env.intersections:
+            self.pygame.draw.circle(background, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
+        return background
+
+    def draw_light(self, intersection, state):
+        """Draw the open direction of an intersection's traffic light; returns the affected area."""
+        center = (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size)
+        area = self.pygame.Rect(center[0] - 18, center[1] - 18, 37, 37)
+        self.screen.blit(self.background, area, area)  # remove previous light bar
+        if state:  # North-South is open
+            self.pygame.draw.line(self.screen, self.colors['green'],
+                (center[0], center[1] - 15), (center[0], center[1] + 15), self.road_width)
+        else:  # East-West is open
+            self.pygame.draw.line(self.screen, self.colors['green'],
+                (center[0] - 15, center[1]), (center[0] + 15, center[1]), self.road_width)
+        return area
+
+    def draw_text(self, text, color, pos):
+        if (text, color) not in self.text_cache:
+            if len(self.text_cache) > 1000:
+                self.text_cache.clear()
+            self.text_cache[(text, color)] = self.font.render(text, True, color, self.bg_color)
+        self.dirty_rects.append(self.screen.blit(self.text_cache[(text, color)], pos))
+
+    def draw_dynamic(self, snapshot):
+        """Draw agents and overlays, recording the areas drawn in self.dirty_rects."""
+        dirty = self.dirty_rects
+        for agent, location, heading, destination, next_waypoint in snapshot.agents:
             # Compute precise agent location here (back from the intersection some)
-            agent_offset = (2 * state['heading'][0] * self.agent_circle_radius, 2 * state['heading'][1] * self.agent_circle_radius)
-            agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
+            agent_offset = (2 * heading[0] * self.agent_circle_radius, 2 * heading[1] * self.agent_circle_radius)
+            agent_pos = (location[0] * self.env.block_size - agent_offset[0], location[1] * self.env.block_size - agent_offset[1])
             agent_color = self.colors[agent.color]
             if hasattr(agent, '_sprite') and agent._sprite is not None:
                 # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
+                dirty.append(self.screen.blit(agent._sprites[heading],
                     self.pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
+                        agent._sprite_size[0], agent._sprite_size[1])))
             else:
                 # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
-            if agent.get_next_waypoint() is not None:
-                self.screen.blit(self.font.render(agent.get_next_waypoint(), True, agent_color, self.bg_color), (agent_pos[0] + 10, agent_pos[1] + 10))
-            if state['destination'] is not None:
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6)
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2)
+                dirty.append(self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius))
+                dirty.append(self.pygame.draw.line(self.screen, agent_color, agent_pos, location, self.road_width))
+            if next_waypoint is not None:
+                self.draw_text(next_waypoint, agent_color, (agent_pos[0] + 10, agent_pos[1] + 10))
+            if destination is not None:
+                dirty.append(self.pygame.draw.circle(self.screen, agent_color, (destination[0] * self.env.block_size, destination[1] * self.env.block_size), 6))
+                dirty.append(self.pygame.draw.circle(self.screen, agent_color, (destination[0] * self.env.block_size, destination[1] * self.env.block_size), 15, 2))
 
         # * Overlays
         text_y = 10
-        for text in self.env.status_text.split('\n'):
-            self.screen.blit(self.font.render(text, True, self.colors['red'], self.bg_color), (100, text_y))
+        for text in snapshot.status_text.split('\n'):
+            self.draw_text(text, self.colors['red'], (100, text_y))
             text_y += 20
 
-        # Flip buffers
-        self.pygame.display.flip()
-
     def pause(self):
         abs_pause_time = time.time()
         pause_text = "[PAUSED] Press any key to continue..."
@@ -167,5 +323,6 @@ class Simulator(object):
                 if event.type == self.pygame.KEYDOWN:
                     self.paused = False
             self.pygame.time.wait(self.frame_delay)
-        self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40))
-        self.start_time += (time.time() - abs_pause_time)
+        self.dirty_rects.append(self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40)))
+        if self.start_time is not None:
+            self.start_time += (time.time() - abs_pause_time)
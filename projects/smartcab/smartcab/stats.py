@@ -1,70 +1,301 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import re 
+import re
 import sys
+import argparse
+from collections import defaultdict
 from cStringIO import StringIO
 
-bad = re.compile('ran out')
-good = re.compile('reached')
+# Only the primary agent's trials are counted; with several learning agents,
+# the others' outcome lines name them by number and their STATS rows have Agent > 0
+bad = re.compile('Primary agent ran out')
+good = re.compile('Primary agent has reached')
 stats = re.compile('(STAT.*)')
 
-bad_c = 0
-good_c = 0
-stats_list = []
-stats_str = StringIO()
-
-for line in sys.stdin:
-    if bad.search(line):
-        bad_c += 1
-    if good.search(line):
-        good_c += 1
-    if stats.search(line):
-        stats_str.write(line)
-
-print 'Reached: {}, timed out: {}'.format(good_c, bad_c)
-
-stats_str.seek(0)
-d = pd.read_csv(stats_str)
-f, ax = plt.subplots(nrows=3, ncols=2, figsize=(10,12))
-
-cols = ['Rewards', 'Steps']
-for i in range(len(cols)):
-    med = d[cols[i]].describe()['50%']
-    lbl = cols[i] + ' (Median: ' + str(med) + ')'
-    ax[0,i].hist(d[cols[i]])
-    ax[0,i].axvline(med, color='r', linewidth=2)
-    ax[0,i].set_xlabel(lbl)
-
-cols = ['Epsilon', 'Alpha']
-for i in range(len(cols)):
-    ax[1,i].scatter(d['Rewards'], d[cols[i]])
-    ax[1,i].set_xlabel('Rewards')
-    ax[1,i].set_ylabel(cols[i])
-    ax[1,i].yaxis.grid()
-    ax[1,i].xaxis.grid()
-
-m, b = np.polyfit(d['Total'], d['Steps'], 1)
-ax[2,0].scatter(d['Total'], d['Steps'])
-ax[2,0].plot(d['Total'], m*d['Total'] + b, '-', color='r', linewidth=2)
-ax[2,0].set_xlabel('Total Steps')
-ax[2,0].set_ylabel('Steps per Trial')
-ax[2,0].yaxis.grid()
-ax[2,0].xaxis.grid()
-
-m, b = np.polyfit(d['Total'], d['Rewards'], 1)
-ax[2,1].scatter(d['Total'], d['Rewards'])
-ax[2,1].plot(d['Total'], m*d['Total'] + b, '-', color='r', linewidth=2)
-ax[2,1].set_xlabel('Total Steps')
-ax[2,1].set_ylabel('Rewards')
-ax[2,1].yaxis.grid()
-ax[2,1].xaxis.grid()
-
-plt.subplots_adjust(wspace=.3)
-plt.subplots_adjust(hspace=.3)
-
-for ax in f.axes[2:]:
-    plt.sca(ax)
-    plt.xticks(rotation=45)
-
-plt.show()
+
+class Histogram(object):
+    """Streaming histogram with fixed-width bins.
+
+    Memory depends only on the value range, not on the number of samples.
+    Values that fall on bin centers (e.g. integer steps, rewards in steps of .5)
+    give exact medians.
+    """
+
+    def __init__(self, width=1.):
+        self.width = width
+        self.counts = defaultdict(int)
+        self.n = 0
+
+    def add(self, v):
+        self.counts[int(round(v / self.width))] += 1
+        self.n += 1
+
+    def bins(self):
+        keys = sorted(self.counts)
+        return [k * self.width for k in keys], [self.counts[k] for k in keys]
+
+    def median(self):
+        """Median, averaging the two middle values for an even count (as pandas does)."""
+        if self.n == 0:
+            return float('nan')
+        lo, hi = (self.n - 1) // 2, self.n // 2
+        values, seen = [], 0
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+            while len(values) < 2 and seen > (lo, hi)[len(values)]:
+                values.append(k * self.width)
+            if len(values) == 2:
+                break
+        return (values[0] + values[1]) / 2.
+
+
+class Histogram2D(object):
+    """Streaming 2D histogram, used in place of a scatter plot of all points."""
+
+    def __init__(self, x_width, y_width):
+        self.x_width, self.y_width = x_width, y_width
+        self.counts = defaultdict(int)
+
+    def add(self, x, y):
+        self.counts[(int(round(x / self.x_width)), int(round(y / self.y_width)))] += 1
+
+    def points(self):
+        keys = self.counts.keys()
+        return ([k[0] * self.x_width for k in keys], [k[1] * self.y_width for k in keys],
+                [self.counts[k] for k in keys])
+
+
+class LinearFit(object):
+    """Least squares line y = m*x + b from running sums (same result as np.polyfit(x, y, 1))."""
+
+    def __init__(self):
+        self.n = 0
+        self.sx = self.sy = self.sxx = self.sxy = 0.
+
+    def add(self, x, y):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sxx += x * x
+        self.sxy += x * y
+
+    def coef(self):
+        d = self.n * self.sxx - self.sx * self.sx
+        if d == 0:
+            return 0., (self.sy / self.n if self.n else 0.)
+        m = (self.n * self.sxy - self.sx * self.sy) / d
+        return m, (self.sy - m * self.sx) / self.n
+
+
+class BucketedMeans(object):
+    """Mean of y over consecutive x buckets, for plotting a series of any length.
+
+    Starts with buckets of width 1 and doubles the width (merging neighbours)
+    whenever more than max_buckets would be needed.
+    """
+
+    def __init__(self, max_buckets=500):
+        self.max_buckets = max_buckets
+        self.width = 1.
+        self.sums = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, x, y):
+        k = int(x // self.width)
+        self.sums[k] += y
+        self.counts[k] += 1
+        if len(self.counts) > self.max_buckets:
+            self.width *= 2
+            sums, counts = self.sums, self.counts
+            self.sums, self.counts = defaultdict(float), defaultdict(int)
+            for k in counts:
+                self.sums[k // 2] += sums[k]
+                self.counts[k // 2] += counts[k]
+
+    def points(self):
+        keys = sorted(self.counts)
+        return ([(k + .5) * self.width for k in keys],
+                [self.sums[k] / self.counts[k] for k in keys])
+
+
+class StreamingStats(object):
+    """Running aggregates over a smartcab log, fed one line at a time."""
+
+    def __init__(self):
+        self.good_c = 0
+        self.bad_c = 0
+        self.trials = 0
+        self.columns = None
+        self.hists = {'Rewards': Histogram(.5), 'Steps': Histogram(1.)}
+        self.scatters = {'Epsilon': Histogram2D(.5, .01), 'Alpha': Histogram2D(.5, .01)}
+        self.series = {'Steps': BucketedMeans(), 'Rewards': BucketedMeans()}
+        self.fits = {'Steps': LinearFit(), 'Rewards': LinearFit()}
+
+    def add_line(self, line):
+        """Update the aggregates from one log line; returns True for a new trial."""
+        if bad.search(line):
+            self.bad_c += 1
+        if good.search(line):
+            self.good_c += 1
+        m = stats.search(line)
+        if not m:
+            return False
+        fields = [f.strip() for f in m.group(1).split(',')[1:]]
+        if self.columns is None:
+            self.columns = fields
+            return False
+        row = dict(zip(self.columns, [float(f) for f in fields]))
+        if row.get('Agent', 0) != 0:
+            return False
+        for col, hist in self.hists.iteritems():
+            hist.add(row[col])
+        for col, hist in self.scatters.iteritems():
+            hist.add(row['Rewards'], row[col])
+        for col in self.series:
+            self.series[col].add(row['Total'], row[col])
+            self.fits[col].add(row['Total'], row[col])
+        self.trials += 1
+        return True
+
+    def plot(self, f, ax):
+        """Draw the aggregates in the same layout as the batch charts."""
+        for a in ax.flat:
+            a.cla()
+
+        cols = ['Rewards', 'Steps']
+        for i in range(len(cols)):
+            hist = self.hists[cols[i]]
+            med = hist.median()
+            lbl = cols[i] + ' (Median: ' + str(med) + ')'
+            x, counts = hist.bins()
+            ax[0,i].bar(x, counts, width=hist.width, align='center')
+            ax[0,i].axvline(med, color='r', linewidth=2)
+            ax[0,i].set_xlabel(lbl)
+
+        cols = ['Epsilon', 'Alpha']
+        for i in range(len(cols)):
+            x, y, counts = self.scatters[cols[i]].points()
+            ax[1,i].scatter(x, y, s=10 + 40 * np.sqrt(counts))
+            ax[1,i].set_xlabel('Rewards')
+            ax[1,i].set_ylabel(cols[i])
+            ax[1,i].yaxis.grid()
+            ax[1,i].xaxis.grid()
+
+        cols = ['Steps', 'Rewards']
+        labels = ['Steps per Trial', 'Rewards']
+        for i in range(len(cols)):
+            x, y = self.series[cols[i]].points()
+            m, b = self.fits[cols[i]].coef()
+            x = np.array(x)
+            ax[2,i].scatter(x, y)
+            ax[2,i].plot(x, m*x + b, '-', color='r', linewidth=2)
+            ax[2,i].set_xlabel('Total Steps')
+            ax[2,i].set_ylabel(labels[i])
+            ax[2,i].yaxis.grid()
+            ax[2,i].xaxis.grid()
+
+        for a in f.axes[2:]:
+            plt.sca(a)
+            plt.xticks(rotation=45)
+
+
+def stream(lines, every=None):
+    """Aggregate a log as it arrives, redrawing the charts every `every` trials."""
+    s = StreamingStats()
+    f, ax = plt.subplots(nrows=3, ncols=2, figsize=(10,12))
+    plt.subplots_adjust(wspace=.3)
+    plt.subplots_adjust(hspace=.3)
+    if every:
+        plt.show(block=False)
+
+    for line in lines:
+        if s.add_line(line) and every and s.trials % every == 0:
+            s.plot(f, ax)
+            f.suptitle('Trials: {}, reached: {}, timed out: {}'.format(s.trials, s.good_c, s.bad_c))
+            plt.pause(.001)  # redraw and process GUI events
+
+    print 'Reached: {}, timed out: {}'.format(s.good_c, s.bad_c)
+
+    s.plot(f, ax)
+    plt.show()
+
+
+def batch(lines):
+    """Read the whole log, then draw the charts from the full set of trials."""
+    bad_c = 0
+    good_c = 0
+    stats_str = StringIO()
+
+    for line in lines:
+        if bad.search(line):
+            bad_c += 1
+        if good.search(line):
+            good_c += 1
+        if stats.search(line):
+            stats_str.write(line)
+
+    print 'Reached: {}, timed out: {}'.format(good_c, bad_c)
+
+    stats_str.seek(0)
+    d = pd.read_csv(stats_str)
+    if 'Agent' in d:  # logs written before the column was added have only the primary agent
+        d = d[d['Agent'] == 0]
+    f, ax = plt.subplots(nrows=3, ncols=2, figsize=(10,12))
+
+    cols = ['Rewards', 'Steps']
+    for i in range(len(cols)):
+        med = d[cols[i]].describe()['50%']
+        lbl = cols[i] + ' (Median: ' + str(med) + ')'
+        ax[0,i].hist(d[cols[i]])
+        ax[0,i].axvline(med, color='r', linewidth=2)
+        ax[0,i].set_xlabel(lbl)
+
+    cols = ['Epsilon', 'Alpha']
+    for i in range(len(cols)):
+        ax[1,i].scatter(d['Rewards'], d[cols[i]])
+        ax[1,i].set_xlabel('Rewards')
+        ax[1,i].set_ylabel(cols[i])
+        ax[1,i].yaxis.grid()
+        ax[1,i].xaxis.grid()
+
+    m, b = np.polyfit(d['Total'], d['Steps'], 1)
+    ax[2,0].scatter(d['Total'], d['Steps'])
+    ax[2,0].plot(d['Total'], m*d['Total'] + b, '-', color='r', linewidth=2)
+    ax[2,0].set_xlabel('Total Steps')
+    ax[2,0].set_ylabel('Steps per Trial')
+    ax[2,0].yaxis.grid()
+    ax[2,0].xaxis.grid()
+
+    m, b = np.polyfit(d['Total'], d['Rewards'], 1)
+    ax[2,1].scatter(d['Total'], d['Rewards'])
+    ax[2,1].plot(d['Total'], m*d['Total'] + b, '-', color='r', linewidth=2)
+    ax[2,1].set_xlabel('Total Steps')
+    ax[2,1].set_ylabel('Rewards')
+    ax[2,1].yaxis.grid()
+    ax[2,1].xaxis.grid()
+
+    plt.subplots_adjust(wspace=.3)
+    plt.subplots_adjust(hspace=.3)
+
+    for ax in f.axes[2:]:
+        plt.sca(ax)
+        plt.xticks(rotation=45)
+
+    plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Charts for a smartcab log read from stdin.')
+    parser.add_argument('--stream', action='store_true',
+        help='keep running aggregates in constant memory instead of loading the whole log')
+    parser.add_argument('--every', type=int, default=None, metavar='N',
+        help='redraw the charts every N trials (implies --stream)')
+    args = parser.parse_args()
+
+    # readline() instead of file iteration so lines from a pipe are seen as they arrive
+    lines = iter(sys.stdin.readline, '')
+    if args.stream or args.every:
+        stream(lines, args.every)
+    else:
+        batch(lines)
@@ -0,0 +1,106 @@
+import argparse
+import itertools
+import random
+import multiprocessing
+import numpy as np
+from agent import LearningAgent
+from environment import Environment
+from simulator import Simulator
+from schedules import Schedule
+from events import OutcomeSink
+
+
+def evaluate(config):
+    """Train one agent with the given schedules and seed; returns per-run metrics.
+
+    Runs stop early once at least min_trials trials are done and the success
+    rate over the last `window` trials is below min_success.
+    """
+    random.seed(config['seed'])
+    np.random.seed(config['seed'])
+
+    sink = OutcomeSink()
+    e = Environment(sink=sink)
+    a = e.create_agent(LearningAgent, epsilon=config['epsilon'], alpha=config['alpha'], gamma=config['gamma'])
+    e.set_primary_agent(a, enforce_deadline=True)
+    sim = Simulator(e, update_delay=0, display=False)
+
+    window = config['window']
+    rewards, steps = [], []
+    pruned = False
+    for trial in xrange(config['n_trials']):
+        sim.run(n_trials=1)
+        rewards.append(a.rewards)
+        steps.append(a.steps_trial)
+        if trial + 1 >= config['min_trials'] and np.mean(sink.reached[-window:]) < config['min_success']:
+            pruned = True
+            break
+
+    return {
+        'key': config['key'],
+        'trials': len(rewards),
+        'pruned': pruned,
+        'success': np.mean(sink.reached[-window:]),
+        'reward': np.mean(rewards[-window:]),
+        'steps': np.mean(steps[-window:])}
+
+
+def sweep(epsilons, alphas, gammas, seeds, n_trials=100, window=20, min_trials=40, min_success=.5, processes=None):
+    """Evaluate every (epsilon, alpha, gamma) combination for each seed on a process pool.
+
+    Returns rows of (epsilon, alpha, gamma, success, reward, steps, pruned runs),
+    averaged over seeds and sorted best first: by success rate over the last
+    `window` trials, then reward, then fewest steps.
+    """
+    configs = []
+    for key in itertools.product(epsilons, alphas, gammas):
+        for seed in seeds:
+            configs.append({'key': key, 'epsilon': key[0], 'alpha': key[1], 'gamma': key[2], 'seed': seed,
+                'n_trials': n_trials, 'window': window, 'min_trials': min_trials, 'min_success': min_success})
+
+    results = {}
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(evaluate, configs):
+            results.setdefault(result['key'], []).append(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    table = []
+    for key, runs in results.iteritems():
+        table.append(key + (np.mean([r['success'] for r in runs]), np.mean([r['reward'] for r in runs]),
+            np.mean([r['steps'] for r in runs]), sum(r['pruned'] for r in runs)))
+    table.sort(key=lambda row: (-row[3], -row[4], row[5]))
+    return table
+
+
+def parse_schedules(families, constants):
+    return [Schedule(f, c) for f in families for c in constants]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search smartcab learning schedules over several seeds in parallel.')
+    parser.add_argument('--epsilon-families', nargs='+', default=['sqrt', 'linear', 'log'], choices=Schedule.families)
+    parser.add_argument('--epsilon-constants', nargs='+', type=float, default=[.5, 1, 2, 5])
+    parser.add_argument('--alpha-families', nargs='+', default=['sqrt', 'linear'], choices=Schedule.families)
+    parser.add_argument('--alpha-constants', nargs='+', type=float, default=[.5, 1, 10])
+    parser.add_argument('--gammas', nargs='+', type=float, default=[0., .2])
+    parser.add_argument('--seeds', type=int, default=3, help='number of seeds per configuration')
+    parser.add_argument('--trials', type=int, default=100)
+    parser.add_argument('--window', type=int, default=20, help='trials used for the running success rate')
+    parser.add_argument('--min-trials', type=int, default=40, help='trials before a run may be stopped early')
+    parser.add_argument('--min-success', type=float, default=.5, help='stop runs whose running success rate falls below this')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20, help='rows of the ranked table to show')
+    args = parser.parse_args()
+
+    table = sweep(parse_schedules(args.epsilon_families, args.epsilon_constants),
+        parse_schedules(args.alpha_families, args.alpha_constants), args.gammas, range(args.seeds),
+        args.trials, args.window, args.min_trials, args.min_success, args.processes)
+
+    print '{:>4} {:>14} {:>14} {:>5} {:>7} {:>7} {:>6} {:>6}'.format(
+        'Rank', 'Epsilon', 'Alpha', 'Gamma', 'Success', 'Reward', 'Steps', 'Pruned')
+    for rank, row in enumerate(table[:args.top]):
+        print '{:4} {:>14} {:>14} {:5.2f} {:7.2f} {:7.2f} {:6.1f} {:6}'.format(
+            rank + 1, repr(row[0]), repr(row[1]), *row[2:])
@@ -0,0 +1,29 @@
+import random
+import unittest
+from agent import LearningAgent
+from environment import Environment
+from events import BufferedSink
+from simulator import Simulator
+
+
+class LearningAgentTest(unittest.TestCase):
+
+    def test_unregistered_learning_agent(self):
+        # A LearningAgent that is neither primary nor an added learner drives
+        # like a dummy: it has no trials of its own and reports no summaries
+        random.seed(0)
+        sink = BufferedSink()
+        e = Environment(sink=sink)
+        a = e.create_agent(LearningAgent)
+        other = e.create_agent(LearningAgent)
+        e.set_primary_agent(a, enforce_deadline=True)
+        Simulator(e, update_delay=0, display=False).run(n_trials=3)
+
+        summaries = sink.records['Summary']
+        self.assertEqual(len(summaries), 2)
+        self.assertTrue(all(s.agent == 0 for s in summaries))
+        self.assertTrue(other.steps_total > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+from schedules import Schedule
+from sweep import sweep
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_schedules_compare_by_value(self):
+        self.assertEqual(Schedule('sqrt', 1), Schedule('sqrt', 1))
+        self.assertEqual(hash(Schedule('sqrt', 1)), hash(Schedule('sqrt', 1)))
+        self.assertNotEqual(Schedule('sqrt', 1), Schedule('linear', 1))
+        self.assertNotEqual(Schedule('sqrt', 1), Schedule('sqrt', 2))
+
+    def test_seeds_are_averaged(self):
+        # Each seed runs in a worker and returns its own copy of the schedules
+        table = sweep([Schedule('sqrt', 1)], [Schedule('constant', .5)], [0.], seeds=[0, 1, 2],
+                      n_trials=2, window=2, min_trials=2, min_success=0, processes=2)
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table[0][:3], (Schedule('sqrt', 1), Schedule('constant', .5), 0.))
+
+
+if __name__ == '__main__':
+    unittest.main()